@@ -1,10 +1,9 @@
 import streamlit as st
-import fitz  # PyMuPDF
-import os
-from pdf2docx import Converter
-import time
-import tempfile
 import hashlib
+from job_scheduler import job_cost
+from merge_engine import MergeConfig
+from streamlit_ui import (drop_result, generate_preview, init_session, new_result, page_count, queued_merge,
+                          show_downloads, show_gallery)
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
@@ -20,6 +19,7 @@ if "puzzle_sequence" not in st.session_state:
     st.session_state.puzzle_sequence = []
 if "login_msg" not in st.session_state:
     st.session_state.login_msg = ""
+init_session()
 if "preview_img" not in st.session_state:
     st.session_state.preview_img = None
 
@@ -168,114 +168,7 @@ st.markdown("""
 
 # --- 4. BACKEND LOGIC ---
 
-def get_visible_content_bottom(page):
-    max_y = 0
-    for block in page.get_text("blocks"):
-        if block[3] > max_y: max_y = block[3]
-    for img in page.get_images(full=True):
-        for r in page.get_image_rects(img[0]):
-            if r.y1 > max_y: max_y = r.y1
-    if max_y == 0: return page.rect.height * 0.15
-    return max_y
-
-def generate_preview(header_file, data_file, y_offset):
-    """Generates an image of the first page for preview."""
-    t_header = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    t_data = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    
-    clean_paths = [t_header.name, t_data.name]
-    
-    try:
-        t_header.write(header_file.getbuffer())
-        t_data.write(data_file.getbuffer())
-        t_header.close(); t_data.close()
-
-        try:
-            h_doc = fitz.open(t_header.name)
-            d_doc = fitz.open(t_data.name)
-        except:
-            return None
-
-        # Create a single page PDF in memory
-        out_doc = fitz.open()
-        h_page = h_doc[0]
-        w, h = h_page.rect.width, h_page.rect.height
-        
-        base_y = get_visible_content_bottom(h_page)
-        start_y = base_y + 10 + y_offset 
-        
-        # Merge only Page 1
-        p = out_doc.new_page(width=w, height=h)
-        p.show_pdf_page(fitz.Rect(0,0,w,h), h_doc, 0)
-        p.show_pdf_page(fitz.Rect(0,start_y,w,h), d_doc, 0)
-        
-        # Convert to Image (Pixmap)
-        pix = p.get_pixmap(dpi=100) # Low DPI for fast preview
-        img_data = pix.tobytes("png")
-        
-        h_doc.close(); d_doc.close(); out_doc.close()
-        return img_data
-
-    except:
-        return None
-    finally:
-        for p in clean_paths:
-            if os.path.exists(p):
-                try: os.remove(p)
-                except: pass
-
-def process_merge(header_file, data_file, mode, y_offset):
-    t_header = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    t_data = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    out_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    out_docx = tempfile.NamedTemporaryFile(delete=False, suffix=".docx").name
-    
-    clean_paths = [t_header.name, t_data.name]
-
-    try:
-        t_header.write(header_file.getbuffer())
-        t_data.write(data_file.getbuffer())
-        t_header.close(); t_data.close()
-
-        try:
-            h_doc = fitz.open(t_header.name)
-            d_doc = fitz.open(t_data.name)
-        except:
-            return None, None, "File Corrupt or Locked (फाइल खराब आहे)"
-
-        out_doc = fitz.open()
-        h_page = h_doc[0]
-        w, h = h_page.rect.width, h_page.rect.height
-        
-        base_y = get_visible_content_bottom(h_page)
-        start_y = base_y + 10 + y_offset 
-        
-        apply_all = (mode == "Apply to All Pages")
-
-        for i in range(len(d_doc)):
-            if i == 0 or apply_all:
-                p = out_doc.new_page(width=w, height=h)
-                p.show_pdf_page(fitz.Rect(0,0,w,h), h_doc, 0)
-                p.show_pdf_page(fitz.Rect(0,start_y,w,h), d_doc, i)
-            else:
-                out_doc.insert_pdf(d_doc, from_page=i, to_page=i)
-
-        out_doc.save(out_pdf)
-        h_doc.close(); d_doc.close(); out_doc.close()
-
-        cv = Converter(out_pdf)
-        cv.convert(out_docx)
-        cv.close()
-
-        return out_pdf, out_docx, None
-
-    except Exception as e:
-        return None, None, str(e)
-    finally:
-        for p in clean_paths:
-            if os.path.exists(p):
-                try: os.remove(p)
-                except: pass
+PREVIEW_WIDTH = 340  # px: the preview sits in one of the two setting columns
 
 # --- 5. AUTH & PUZZLE ---
 
@@ -347,6 +240,7 @@ st.markdown("<p style='text-align:center;'>Secure Document Portal</p>", unsafe_a
 if st.sidebar.button("🔒 Logout"):
     st.session_state.auth_status = "locked"
     st.session_state.puzzle_sequence = []
+    drop_result()
     st.rerun()
 
 st.markdown("<br>", unsafe_allow_html=True)
@@ -375,19 +269,25 @@ with sc1:
 with sc2:
     # Slider
     y_offset = st.slider("Vertical Position (Slider)", min_value=-50, max_value=200, value=0, help="Move text DOWN to make space for stamp.")
+    cfg = MergeConfig(mode=mode, y_offset=y_offset)
     
     # PREVIEW BUTTON
     if st.button("👁️ Show Preview (प्रीव्ह्यू पहा)"):
         if up_h and up_d:
             with st.spinner("Generating Preview..."):
-                img_bytes = generate_preview(up_h, up_d, y_offset)
-                if img_bytes:
-                    st.image(img_bytes, caption="Page 1 Preview (First Page)", use_container_width=True)
-                else:
+                slot, shown = st.empty(), False
+                for img_bytes in generate_preview(up_h, up_d, cfg, PREVIEW_WIDTH):
+                    slot.image(img_bytes, caption="Page 1 Preview (First Page)", use_container_width=True)
+                    shown = True
+                if not shown:
                     st.error("Preview failed. Check files.")
         else:
             st.warning("Upload files first!")
 
+# PAGE GALLERY
+if up_h and up_d and st.checkbox("🗂️ Show All Pages (सर्व पाने पहा)"):
+    show_gallery(up_h, up_d, cfg)
+
 st.markdown("</div>", unsafe_allow_html=True)
 
 # GENERATE
@@ -395,11 +295,8 @@ st.markdown("<br>", unsafe_allow_html=True)
 if st.button("🚜 GENERATE DOCUMENT (फाइल बनवा)"):
     if up_h and up_d:
         with st.status("Processing... (प्रक्रिया सुरू आहे)", expanded=True) as status:
-            st.write("🌿 Reading Files...")
-            time.sleep(0.5)
-            st.write("⚙️ Merging with Custom Positioning...")
-            
-            pdf, docx, err = process_merge(up_h, up_d, mode, y_offset)
+            pages = page_count(up_d)
+            pdf, err = queued_merge(status, "⚙️ Merging with Custom Positioning...", job_cost(pages, docx=True), up_h, up_d, cfg)
             
             if err:
                 status.update(label="Error", state="error")
@@ -409,16 +306,13 @@ if st.button("🚜 GENERATE DOCUMENT (फाइल बनवा)"):
                 clean_name = "".join(x for x in custom_name if x.isalnum() or x in "_-")
                 if not clean_name: clean_name = "Document"
                 
+                drop_result()
+                st.session_state.result = new_result(pdf, clean_name, (up_h.file_id, up_d.file_id),
+                                                     job_cost(pages, merge=False, docx=True))
                 st.balloons()
-                st.success("✅ Files Ready!")
-                
-                d1, d2 = st.columns(2)
-                with d1:
-                    with open(pdf, "rb") as f:
-                        st.download_button("⬇ Download PDF", f, file_name=f"{clean_name}.pdf", mime="application/pdf", use_container_width=True)
-                with d2:
-                    with open(docx, "rb") as f:
-                        st.download_button("⬇ Download Word", f, file_name=f"{clean_name}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
-                os.remove(pdf); os.remove(docx)
+                st.success("✅ PDF Ready! Word file follows shortly.")
     else:
         st.warning("⚠️ Please upload both files!")
+
+# DOWNLOADS (Word arrives from a background job)
+show_downloads(up_h, up_d)
@@ -1,10 +1,7 @@
 import streamlit as st
-import fitz  # PyMuPDF
-import os
-from pdf2docx import Converter
 import time
-import tempfile
 import hashlib
+from merge_engine import HeaderCache, MergeConfig, merge_pdf, open_upload, pdf_to_docx
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
@@ -170,66 +167,25 @@ st.markdown("""
 
 # --- 4. BACKEND LOGIC ---
 
-def get_visible_content_bottom(page):
-    max_y = 0
-    for block in page.get_text("blocks"):
-        if block[3] > max_y: max_y = block[3]
-    for img in page.get_images(full=True):
-        for r in page.get_image_rects(img[0]):
-            if r.y1 > max_y: max_y = r.y1
-    if max_y == 0: return page.rect.height * 0.15
-    return max_y
+@st.cache_resource
+def get_header_cache():
+    """One letterhead cache shared by every session of this server."""
+    return HeaderCache()
 
 def process_merge(header_file, data_file, mode):
-    t_header = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    t_data = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    out_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    out_docx = tempfile.NamedTemporaryFile(delete=False, suffix=".docx").name
-    
-    clean_paths = [t_header.name, t_data.name]
-
     try:
-        t_header.write(header_file.getbuffer())
-        t_data.write(data_file.getbuffer())
-        t_header.close(); t_data.close()
-
-        try:
-            h_doc = fitz.open(t_header.name)
-            d_doc = fitz.open(t_data.name)
-        except:
-            return None, None, "File Corrupt or Locked (फाइल खराब आहे)"
-
-        out_doc = fitz.open()
-        h_page = h_doc[0]
-        w, h = h_page.rect.width, h_page.rect.height
-        start_y = get_visible_content_bottom(h_page) + 20
-        
-        apply_all = (mode == "Apply to All Pages")
-
-        for i in range(len(d_doc)):
-            if i == 0 or apply_all:
-                p = out_doc.new_page(width=w, height=h)
-                p.show_pdf_page(fitz.Rect(0,0,w,h), h_doc, 0)
-                p.show_pdf_page(fitz.Rect(0,start_y,w,h), d_doc, i)
-            else:
-                out_doc.insert_pdf(d_doc, from_page=i, to_page=i)
-
-        out_doc.save(out_pdf)
-        h_doc.close(); d_doc.close(); out_doc.close()
-
-        cv = Converter(out_pdf)
-        cv.convert(out_docx)
-        cv.close()
-
-        return out_pdf, out_docx, None
+        hinfo = get_header_cache().analyze(header_file.getbuffer())
+        d_doc = open_upload(data_file)
+    except:
+        return None, None, "File Corrupt or Locked (फाइल खराब आहे)"
 
+    try:
+        pdf_bytes = merge_pdf(hinfo, d_doc, MergeConfig(mode=mode, gap=20))
+        return pdf_bytes, pdf_to_docx(pdf_bytes), None
     except Exception as e:
         return None, None, str(e)
     finally:
-        for p in clean_paths:
-            if os.path.exists(p):
-                try: os.remove(p)
-                except: pass
+        d_doc.close()
 
 # --- 5. AUTH & PUZZLE ---
 
@@ -377,13 +333,8 @@ if st.button("🚜 GENERATE DOCUMENT (फाइल बनवा)"):
                 
                 d1, d2 = st.columns(2)
                 with d1:
-                    with open(pdf, "rb") as f:
-                        st.download_button("⬇ Download PDF", f, file_name=f"{clean_name}.pdf", mime="application/pdf", use_container_width=True)
+                    st.download_button("⬇ Download PDF", pdf, file_name=f"{clean_name}.pdf", mime="application/pdf", use_container_width=True)
                 with d2:
-                    with open(docx, "rb") as f:
-                        st.download_button("⬇ Download Word", f, file_name=f"{clean_name}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
-                
-                os.remove(pdf)
-                os.remove(docx)
+                    st.download_button("⬇ Download Word", docx, file_name=f"{clean_name}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
     else:
         st.warning("⚠️ Please upload both files!")
@@ -1,11 +1,9 @@
 import streamlit as st
-import fitz  # PyMuPDF
-import os
-from pdf2docx import Converter
-import time
-import tempfile
 import hashlib
-from PIL import Image
+from job_scheduler import job_cost
+from merge_engine import MergeConfig, LAYOUT_FIT, LAYOUT_FLOW, file_type
+from streamlit_ui import (drop_result, generate_preview, init_session, new_result, page_count, queued_merge,
+                          show_downloads, show_gallery)
 
 # --- 1. PAGE CONFIGURATION (FORCE LIGHT MODE) ---
 st.set_page_config(
@@ -22,6 +20,7 @@ if "puzzle_sequence" not in st.session_state:
     st.session_state.puzzle_sequence = []
 if "login_msg" not in st.session_state:
     st.session_state.login_msg = ""
+init_session()
 
 # --- 3. FARM THEME (FORCED OVERRIDE) ---
 st.markdown("""
@@ -148,146 +147,8 @@ st.markdown("""
 
 # --- 4. BACKEND LOGIC ---
 
-def get_visible_content_bottom(page):
-    """Finds the lowest point of content on a PDF page."""
-    max_y = 0
-    try:
-        for block in page.get_text("blocks"):
-            if block[3] > max_y: max_y = block[3]
-        for img in page.get_images(full=True):
-            for r in page.get_image_rects(img[0]):
-                if r.y1 > max_y: max_y = r.y1
-    except:
-        pass
-    if max_y == 0: return page.rect.height * 0.15
-    return max_y
-
-def convert_to_pdf_doc(uploaded_file):
-    """Helper: Takes any uploaded file (PDF, PNG, JPG) and returns a PyMuPDF Document object."""
-    file_bytes = uploaded_file.read()
-    filename = uploaded_file.name.lower()
-    uploaded_file.seek(0) # Reset pointer
-
-    # 1. If PDF, open directly
-    if filename.endswith(".pdf"):
-        try:
-            return fitz.open(stream=file_bytes, filetype="pdf")
-        except:
-            return None
-
-    # 2. If Image, convert to PDF in memory
-    if filename.endswith((".png", ".jpg", ".jpeg")):
-        try:
-            img_doc = fitz.open(stream=file_bytes, filetype=filename.split('.')[-1])
-            pdf_bytes = img_doc.convert_to_pdf()
-            img_doc.close()
-            return fitz.open("pdf", pdf_bytes)
-        except:
-            return None
-    
-    return None
-
-def generate_preview(header_file, data_file, y_offset, header_scale, use_standard):
-    try:
-        h_doc = convert_to_pdf_doc(header_file)
-        d_doc = convert_to_pdf_doc(data_file)
-
-        if not h_doc or not d_doc:
-            return None
-
-        out_doc = fitz.open()
-        h_page = h_doc[0]
-        w, h = h_page.rect.width, h_page.rect.height
-        
-        # Positioning
-        if use_standard:
-            start_y = 130 + y_offset
-        else:
-            base_y = get_visible_content_bottom(h_page)
-            start_y = base_y + 10 + y_offset 
-
-        scaled_h = h * (header_scale / 100.0)
-        
-        p = out_doc.new_page(width=w, height=h)
-        p.show_pdf_page(fitz.Rect(0, 0, w, scaled_h), h_doc, 0)
-        p.show_pdf_page(fitz.Rect(0, start_y, w, h), d_doc, 0)
-        
-        pix = p.get_pixmap(dpi=100) 
-        img_data = pix.tobytes("png")
-        
-        h_doc.close(); d_doc.close(); out_doc.close()
-        return img_data
-
-    except Exception as e:
-        return None
-
-def process_merge(header_file, data_file, mode, y_offset, header_scale, use_standard):
-    # Temp files logic
-    ext_h = os.path.splitext(header_file.name)[1].lower()
-    ext_d = os.path.splitext(data_file.name)[1].lower()
-
-    t_header = tempfile.NamedTemporaryFile(delete=False, suffix=ext_h)
-    t_data = tempfile.NamedTemporaryFile(delete=False, suffix=ext_d)
-    out_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    out_docx = tempfile.NamedTemporaryFile(delete=False, suffix=".docx").name
-    clean_paths = [t_header.name, t_data.name]
-
-    try:
-        t_header.write(header_file.getbuffer())
-        t_data.write(data_file.getbuffer())
-        t_header.close(); t_data.close()
-
-        # Word File Rejection (Stability Check)
-        if ext_d == ".docx":
-            return None, None, "Please upload PDF or Image. (Word conversion disabled for stability)"
-
-        # Convert to PDF Docs
-        h_doc = convert_to_pdf_doc(header_file)
-        d_doc = convert_to_pdf_doc(data_file)
-
-        if not h_doc or not d_doc:
-            return None, None, "Could not read files. Ensure they are valid PDF or Images."
-
-        out_doc = fitz.open()
-        h_page = h_doc[0]
-        w, h = h_page.rect.width, h_page.rect.height
-        
-        # Positioning Logic
-        if use_standard:
-            start_y = 130 + y_offset 
-        else:
-            base_y = get_visible_content_bottom(h_page)
-            start_y = base_y + 10 + y_offset 
-        
-        scaled_h = h * (header_scale / 100.0)
-        apply_all = (mode == "Apply to All Pages")
-
-        # Merge Loop
-        for i in range(len(d_doc)):
-            if i == 0 or apply_all:
-                p = out_doc.new_page(width=w, height=h)
-                p.show_pdf_page(fitz.Rect(0, 0, w, scaled_h), h_doc, 0)
-                p.show_pdf_page(fitz.Rect(0, start_y, w, h), d_doc, i)
-            else:
-                out_doc.insert_pdf(d_doc, from_page=i, to_page=i)
-
-        out_doc.save(out_pdf)
-        h_doc.close(); d_doc.close(); out_doc.close()
-
-        # Create Word version
-        cv = Converter(out_pdf)
-        cv.convert(out_docx)
-        cv.close()
-
-        return out_pdf, out_docx, None
-
-    except Exception as e:
-        return None, None, str(e)
-    finally:
-        for p in clean_paths:
-            if os.path.exists(p):
-                try: os.remove(p)
-                except: pass
+PREVIEW_WIDTH = 704  # px: the main column of the centered layout
+READ_ERROR = "Could not read files. Ensure they are valid PDF or Images."
 
 # --- 5. AUTH & PUZZLE ---
 
@@ -359,6 +220,7 @@ st.markdown("<p style='text-align:center;'>Secure Document Portal</p>", unsafe_a
 if st.sidebar.button("🔒 Logout"):
     st.session_state.auth_status = "locked"
     st.session_state.puzzle_sequence = []
+    drop_result()
     st.rerun()
 
 st.markdown("<br>", unsafe_allow_html=True)
@@ -380,6 +242,8 @@ tab1, tab2 = st.tabs(["📏 Layout", "📐 Header Sizer"])
 
 with tab1:
     mode = st.radio("Header Mode", ["Apply to First Page Only", "Apply to All Pages"], horizontal=True)
+    layout = st.radio("Long Content", [LAYOUT_FIT, LAYOUT_FLOW], horizontal=True,
+                      help="Flow keeps the text full size and moves what does not fit onto the next page.")
     st.markdown("---")
     use_standard = st.checkbox("✅ Use Industry Standard Gap (1.8 inches)", value=False)
     y_offset = st.slider("Fine-Tune Position (+/-)", min_value=-100, max_value=200, value=0)
@@ -388,20 +252,27 @@ with tab2:
     st.info("Shrink the header if it looks too big.")
     header_scale = st.slider("Header Size %", min_value=50, max_value=100, value=100)
 
+cfg = MergeConfig(mode=mode, y_offset=y_offset, header_scale=header_scale, use_standard=use_standard, layout=layout)
+
 st.markdown("---")
 custom_name = st.text_input("Output Filename:", value="Bio_Farm_Doc")
 
 if st.button("👁️ Show Preview (प्रीव्ह्यू पहा)"):
     if up_h and up_d:
         with st.spinner("Generating Preview..."):
-            img_bytes = generate_preview(up_h, up_d, y_offset, header_scale, use_standard)
-            if img_bytes:
-                st.image(img_bytes, caption="Page 1 Preview", use_container_width=True)
-            else:
+            slot, shown = st.empty(), False
+            for img_bytes in generate_preview(up_h, up_d, cfg, PREVIEW_WIDTH):
+                slot.image(img_bytes, caption="Page 1 Preview", use_container_width=True)
+                shown = True
+            if not shown:
                 st.error("Preview failed. Ensure valid files.")
     else:
         st.warning("Upload files first!")
 
+# PAGE GALLERY
+if up_h and up_d and st.checkbox("🗂️ Show All Pages (सर्व पाने पहा)"):
+    show_gallery(up_h, up_d, cfg)
+
 st.markdown("</div>", unsafe_allow_html=True)
 
 # GENERATE
@@ -409,11 +280,12 @@ st.markdown("<br>", unsafe_allow_html=True)
 if st.button("🚜 GENERATE DOCUMENT (फाइल बनवा)"):
     if up_h and up_d:
         with st.status("Processing... (प्रक्रिया सुरू आहे)", expanded=True) as status:
-            st.write("🌿 Reading Files...")
-            time.sleep(0.5)
-            st.write("⚙️ Merging...")
-            
-            pdf, docx, err = process_merge(up_h, up_d, mode, y_offset, header_scale, use_standard)
+            # Word File Rejection (Stability Check)
+            if file_type(up_d.name) == "docx":
+                pdf, err = None, "Please upload PDF or Image. (Word conversion disabled for stability)"
+            else:
+                pages = page_count(up_d)
+                pdf, err = queued_merge(status, "⚙️ Merging...", job_cost(pages, docx=True), up_h, up_d, cfg, READ_ERROR)
             
             if err:
                 status.update(label="Error", state="error")
@@ -423,16 +295,13 @@ if st.button("🚜 GENERATE DOCUMENT (फाइल बनवा)"):
                 clean_name = "".join(x for x in custom_name if x.isalnum() or x in "_-")
                 if not clean_name: clean_name = "Document"
                 
+                drop_result()
+                st.session_state.result = new_result(pdf, clean_name, (up_h.file_id, up_d.file_id),
+                                                     job_cost(pages, merge=False, docx=True))
                 st.balloons()
-                st.success("✅ Files Ready!")
-                
-                d1, d2 = st.columns(2)
-                with d1:
-                    with open(pdf, "rb") as f:
-                        st.download_button("⬇ Download PDF", f, file_name=f"{clean_name}.pdf", mime="application/pdf", use_container_width=True)
-                with d2:
-                    with open(docx, "rb") as f:
-                        st.download_button("⬇ Download Word", f, file_name=f"{clean_name}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
-                os.remove(pdf); os.remove(docx)
+                st.success("✅ PDF Ready! Word file follows shortly.")
     else:
         st.warning("⚠️ Please upload both files!")
+
+# DOWNLOADS (Word arrives from a background job)
+show_downloads(up_h, up_d)
@@ -0,0 +1,179 @@
+"""Headless letterhead merge for whole folders of content PDFs.
+
+Usage:
+    python batch_merge.py HEADER.pdf CONTENT [CONTENT ...] -o OUT_DIR [options]
+
+CONTENT can be a PDF file, a directory (all *.pdf inside) or a glob such as
+"invoices/2024-*.pdf". Each content file is written to OUT_DIR under the same
+name; two inputs with the same name are refused. Next to each output,
+OUT.pdf.json records the settings it was made with. Outputs newer than both
+their content file and the header, made with the same settings (and with
+their .docx when --docx is given), are skipped, so an interrupted
+month-end run can simply be started again.
+"""
+import argparse
+import dataclasses
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+
+from merge_engine import (BOTTOM_AUTO, BOTTOM_MODES, LAYOUT_FIT, LAYOUT_FLOW, MODE_ALL, MODE_FIRST, HeaderCache, MergeConfig,
+                          merge_to_file, pdf_to_docx)
+
+_headers = HeaderCache(max_entries=4)  # per worker process
+
+def collect_inputs(patterns):
+    """Expands files, directories and globs into a sorted list of PDF paths."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found.update(glob.glob(os.path.join(pattern, "*.pdf")))
+        elif any(c in pattern for c in "*?["):
+            found.update(p for p in glob.glob(pattern) if p.lower().endswith(".pdf"))
+        elif os.path.isfile(pattern):
+            found.add(pattern)
+    return sorted(found)
+
+def merge_settings(cfg, bottom_mode):
+    """What an output depends on besides its inputs, as stored in its .json sidecar."""
+    return {"config": dataclasses.asdict(cfg), "bottom_mode": bottom_mode}
+
+def settings_path(out_path):
+    return out_path + ".json"
+
+def docx_path(out_path):
+    return os.path.splitext(out_path)[0] + ".docx"
+
+def is_up_to_date(out_path, settings, docx, *sources):
+    """True if out_path is newer than every source, was made with `settings`, and has its .docx if wanted."""
+    if not os.path.exists(out_path):
+        return False
+    try:
+        with open(settings_path(out_path)) as f:
+            if json.load(f) != settings: return False
+    except (OSError, ValueError):
+        return False
+    if docx and not (os.path.exists(docx_path(out_path))
+                     and os.path.getmtime(docx_path(out_path)) >= os.path.getmtime(out_path)):
+        return False
+    return os.path.getmtime(out_path) >= max(os.path.getmtime(s) for s in sources)
+
+def _write_atomic(path, write):
+    """Calls write(tmp_path), then moves the file into place; removes the partial file on failure."""
+    tmp = path + ".part"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+def merge_file(header_path, content_path, out_path, cfg, docx, bottom_mode=BOTTOM_AUTO, stamp_workers=1):
+    """Worker: merges one content file and writes the output atomically.
+
+    Files are already merged in parallel, so each one is stamped in its
+    worker unless it is the only file (then stamp_workers processes help).
+    The settings sidecar is written last, so an output whose run was cut
+    short is redone next time.
+    """
+    t0 = time.perf_counter()
+    with open(header_path, "rb") as f:
+        hinfo = _headers.analyze(f.read(), bottom_mode=bottom_mode)
+    try: os.remove(settings_path(out_path))
+    except OSError: pass
+    def merge(tmp):
+        with fitz.open(content_path) as d_doc:
+            merge_to_file(hinfo.doc, d_doc, tmp, cfg, hinfo.bottom, workers=stamp_workers)
+    _write_atomic(out_path, merge)
+
+    if docx:
+        with open(out_path, "rb") as f: pdf_bytes = f.read()
+        def convert(tmp):
+            with open(tmp, "wb") as f: f.write(pdf_to_docx(pdf_bytes))
+        _write_atomic(docx_path(out_path), convert)
+    def settings(tmp):
+        with open(tmp, "w") as f: json.dump(merge_settings(cfg, bottom_mode), f)
+    _write_atomic(settings_path(out_path), settings)
+    return time.perf_counter() - t0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Merge a letterhead onto many content PDFs.")
+    ap.add_argument("header", help="letterhead PDF (page 1 is used)")
+    ap.add_argument("content", nargs="+", help="content PDFs, directories or globs")
+    ap.add_argument("-o", "--out-dir", required=True, help="where merged PDFs are written")
+    ap.add_argument("--mode", choices=["first", "all"], default="first", help="stamp the first page only, or every page")
+    ap.add_argument("--y-offset", type=float, default=0, help="move the content down (+) or up (-) in points")
+    ap.add_argument("--header-scale", type=float, default=100, help="header size in percent")
+    ap.add_argument("--standard", action="store_true", help="use the industry standard gap (1.8 inches)")
+    ap.add_argument("--flow", action="store_true", help="keep content full size and flow the overflow onto extra pages")
+    ap.add_argument("--bottom-mode", choices=BOTTOM_MODES, default=BOTTOM_AUTO,
+                    help="find the header bottom from its text/images/drawings (vector), its pixels (raster), or pick per header (auto)")
+    ap.add_argument("--no-stamp", action="store_true",
+                    help="re-impose every stamped page as a new page instead of drawing the header into the original")
+    ap.add_argument("--docx", action="store_true", help="also write a Word version of each output")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--force", action="store_true", help="re-merge even if the output is up to date")
+    args = ap.parse_args(argv)
+
+    cfg = MergeConfig(mode=MODE_ALL if args.mode == "all" else MODE_FIRST, y_offset=args.y_offset,
+                      header_scale=args.header_scale, use_standard=args.standard,
+                      layout=LAYOUT_FLOW if args.flow else LAYOUT_FIT, stamp=not args.no_stamp)
+    os.makedirs(args.out_dir, exist_ok=True)
+    out_dir = os.path.abspath(args.out_dir)
+
+    inputs = collect_inputs(args.content)
+    by_name = {}
+    for path in inputs:
+        by_name.setdefault(os.path.basename(path), []).append(path)
+    clashes = {name: paths for name, paths in by_name.items() if len(paths) > 1}
+    if clashes:
+        for name, paths in sorted(clashes.items()):
+            print(f"error: {len(paths)} inputs would all be written to {name}: {', '.join(paths)}", file=sys.stderr)
+        print("Rename them or run each folder into its own OUT_DIR.", file=sys.stderr)
+        return 2
+
+    settings = merge_settings(cfg, args.bottom_mode)
+    todo, skipped = [], 0
+    for path in inputs:
+        out_path = os.path.join(out_dir, os.path.basename(path))
+        if os.path.abspath(path) == out_path:
+            print(f"skip {path}: output would overwrite the input", file=sys.stderr)
+            skipped += 1
+        elif not args.force and is_up_to_date(out_path, settings, args.docx, path, args.header):
+            skipped += 1
+        else:
+            todo.append((path, out_path))
+
+    if not todo:
+        print(f"Nothing to do ({skipped} skipped).", file=sys.stderr)
+        return 0
+
+    t0 = time.perf_counter()
+    failed = 0
+    stamp_workers = None if len(todo) == 1 and args.jobs > 1 else 1  # None: merge_engine decides by page count
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(merge_file, args.header, path, out_path, cfg, args.docx, args.bottom_mode,
+                               stamp_workers): path
+                   for path, out_path in todo}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                status = f"ok ({future.result():.2f}s)"
+            except Exception as e:
+                failed += 1
+                status = f"FAILED: {e}"
+            print(f"[{done:>{len(str(len(todo)))}}/{len(todo)}] {os.path.basename(path)}  {status}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - t0
+    print(f"Merged {len(todo) - failed}, failed {failed}, skipped {skipped} in {elapsed:.1f}s "
+          f"({len(todo) / elapsed:.1f} files/s).", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""Measures page-parallel pdf2docx throughput for increasing worker counts.
+
+Usage: python benchmarks/bench_docx_parallel.py [pages] [max_workers]
+"""
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import submit_docx
+
+def make_content(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 80), f"Statement page {i + 1}", fontsize=14)
+        for row in range(30):
+            page.insert_text((72, 110 + row * 20), f"{row + 1:>3}  Lorem ipsum dolor sit amet  {row * 137.5:>12.2f}", fontsize=10)
+    return doc.tobytes()
+
+def warm_up():
+    import pdf2docx  # noqa: F401  (pay the import once per worker, outside the timing)
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    pdf_bytes = make_content(pages)
+
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n); n *= 2
+    counts.append(max_workers)
+
+    print(f"{pages} pages, {os.cpu_count()} CPUs")
+    base = None
+    for workers in counts:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for f in [pool.submit(warm_up) for _ in range(workers)]: f.result()
+            t0 = time.perf_counter()
+            submit_docx(pdf_bytes, workers=workers, pool=pool).result()
+            dt = time.perf_counter() - t0
+        base = base or dt
+        print(f"workers {workers:>3}  {dt:7.2f}s  {pages / dt:7.1f} pages/s  speedup {base / dt:4.2f}x")
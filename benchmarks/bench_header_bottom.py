@@ -0,0 +1,55 @@
+"""Compares the old text-blocks + image-rects bottom detection with the single-pass
+vector scan and the low-DPI raster scan.
+
+Usage: python benchmarks/bench_header_bottom.py [letterhead.pdf ...]
+
+Without arguments it runs on the synthetic letterhead styles; pass real
+letterheads to check them too (page 1 of each is used).
+"""
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import get_raster_content_bottom, get_visible_content_bottom
+from synthetic import LETTERHEAD_STYLES, make_letterhead
+
+def bottom_legacy(page):
+    max_y = 0
+    try:
+        for block in page.get_text("blocks"):
+            if block[3] > max_y: max_y = block[3]
+        for img in page.get_images(full=True):
+            for r in page.get_image_rects(img[0]):
+                if r.y1 > max_y: max_y = r.y1
+    except:
+        pass
+    if max_y == 0: return page.rect.height * 0.15
+    return max_y
+
+def best_ms(fn, page, budget=0.5):
+    """Best of as many runs as fit in `budget` seconds (at least 3)."""
+    times, start = [], time.perf_counter()
+    while len(times) < 3 or time.perf_counter() - start < budget:
+        t0 = time.perf_counter()
+        fn(page)
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        letterheads = [(os.path.basename(p), open(p, "rb").read()) for p in sys.argv[1:]]
+    else:
+        letterheads = [(style, make_letterhead(style)) for style in LETTERHEAD_STYLES]
+
+    print(f"{'letterhead':<24} {'legacy ms':>10} {'vector ms':>10} {'raster ms':>10}   "
+          f"{'legacy y':>9} {'vector y':>9} {'raster y':>9}")
+    for name, data in letterheads:
+        with fitz.open("pdf", data) as doc:
+            page = doc[0]
+            fns = (bottom_legacy, get_visible_content_bottom, get_raster_content_bottom)
+            ms = "".join(f"{best_ms(fn, page):>11.3f}" for fn in fns)
+            ys = "".join(f"{fn(page):>10.1f}" for fn in fns)
+            print(f"{name:<24}{ms}  {ys}")
@@ -0,0 +1,64 @@
+"""Compares the old per-page header loop with the shared header XObject.
+
+Usage: python benchmarks/bench_header_xobject.py [pages]
+"""
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import build_shared_header, stamp_header
+
+def make_header():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "SUPER AAI BIO ENERGY PVT LTD", fontsize=24)
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1200, 240), 0)
+    pix.set_rect(pix.irect, (30, 120, 60))
+    page.insert_image(fitz.Rect(50, 70, 550, 130), pixmap=pix)
+    page.draw_rect(fitz.Rect(40, 140, 560, 142), color=(0, 0, 0), fill=(0, 0, 0))
+    return doc
+
+def make_content(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 100), f"Statement page {i + 1}\n" + "Lorem ipsum dolor sit amet " * 12, fontsize=10)
+    return doc
+
+def merge_legacy(h_doc, d_doc, start_y):
+    out_doc = fitz.open()
+    w, h = h_doc[0].rect.width, h_doc[0].rect.height
+    for i in range(len(d_doc)):
+        p = out_doc.new_page(width=w, height=h)
+        p.show_pdf_page(fitz.Rect(0, 0, w, h), h_doc, 0)
+        p.show_pdf_page(fitz.Rect(0, start_y, w, h), d_doc, i)
+    return out_doc
+
+def merge_shared(h_doc, d_doc, start_y):
+    out_doc = fitz.open()
+    w, h = h_doc[0].rect.width, h_doc[0].rect.height
+    header = build_shared_header(out_doc, h_doc, w, h, fitz.Rect(0, 0, w, h))
+    for i in range(len(d_doc)):
+        p = out_doc.new_page(width=w, height=h)
+        stamp_header(p, header)
+        p.show_pdf_page(fitz.Rect(0, start_y, w, h), d_doc, i)
+    return out_doc
+
+def run(name, merge, h_doc, d_doc):
+    t0 = time.perf_counter()
+    out_doc = merge(h_doc, d_doc, 150)
+    t1 = time.perf_counter()
+    data = out_doc.tobytes()
+    t2 = time.perf_counter()
+    print(f"{name:<8} stamp {t1 - t0:7.3f}s  save {t2 - t1:7.3f}s  size {len(data) / 1024:9.1f} KiB  objects {out_doc.xref_length()}")
+    out_doc.close()
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    h_doc, d_doc = make_header(), make_content(pages)
+    print(f"{pages} pages, Apply to All Pages")
+    run("legacy", merge_legacy, h_doc, d_doc)
+    run("shared", merge_shared, h_doc, d_doc)
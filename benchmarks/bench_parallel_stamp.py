@@ -0,0 +1,56 @@
+"""Finds the page count from which parallel stamping beats in-process stamping.
+
+Merges synthetic content of growing length with 1 worker and with N, and
+prints the first page count where N workers are faster. Compare it with
+merge_engine.PARALLEL_PAGES. The worker pool is started before timing,
+as on a running server.
+
+Usage: python benchmarks/bench_parallel_stamp.py [--pages 100 300 1000 3000] [--workers N] [--flow] [--no-stamp]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import merge_engine
+from merge_engine import (LAYOUT_FIT, LAYOUT_FLOW, MODE_ALL, HeaderCache, MergeConfig, get_stamp_pool, merge_pdf,
+                          open_document)
+from synthetic import KINDS, make_content, make_header
+
+def best_s(hinfo, content, cfg, workers, repeat):
+    times = []
+    for _ in range(repeat):
+        d_doc = open_document(content)
+        t0 = time.perf_counter()
+        try:
+            merge_pdf(hinfo, d_doc, cfg, workers=workers)
+        finally:
+            d_doc.close()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pages", nargs="+", type=int, default=[100, 300, 1000, 3000])
+    ap.add_argument("--workers", type=int, default=merge_engine.STAMP_WORKERS)
+    ap.add_argument("--kind", choices=KINDS, default="text")
+    ap.add_argument("--flow", action="store_true")
+    ap.add_argument("--no-stamp", action="store_true")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    hinfo = HeaderCache().analyze(make_header())
+    cfg = MergeConfig(mode=MODE_ALL, layout=LAYOUT_FLOW if args.flow else LAYOUT_FIT, stamp=not args.no_stamp)
+    merge_engine.STAMP_WORKERS = args.workers
+    list(get_stamp_pool().map(abs, range(args.workers)))  # start the workers
+
+    print(f"{os.cpu_count()} CPUs, {args.workers} workers, PARALLEL_PAGES = {merge_engine.PARALLEL_PAGES}")
+    crossover = None
+    for pages in args.pages:
+        content = make_content(args.kind, pages)
+        serial = best_s(hinfo, content, cfg, 1, args.repeat)
+        parallel = best_s(hinfo, content, cfg, args.workers, args.repeat)
+        print(f"{pages:>6} pages  serial {serial:8.3f}s  parallel {parallel:8.3f}s  speed-up {serial / parallel:5.2f}x")
+        if crossover is None and parallel < serial: crossover = pages
+    print(f"crossover: {crossover or 'none in range'}")
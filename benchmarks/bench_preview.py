@@ -0,0 +1,67 @@
+"""Preview encode time and bytes by display width, format and quality.
+
+For each content kind, composites the first-page preview at the dpi
+preview_dpi picks for each display width and encodes it in each format.
+The draft row is the first image of the progressive preview. Times are
+the "preview_encode" stage only; the rasters are cached before timing,
+as after the first preview of a session.
+
+Usage: python benchmarks/bench_preview.py [--widths 340 704 1400] [--formats JPEG:80 WEBP:80 PNG] [--kinds text scanned]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import (DRAFT_QUALITY, PREVIEW_DRAFT_DPI, PREVIEW_FORMAT, ContentRasterCache, HeaderCache, MergeConfig,
+                          composite_preview, preview_dpi)
+from synthetic import KINDS, make_content, make_header
+
+class EncodeTimes(logging.Handler):
+    """Collects the seconds of "preview_encode" records from the metrics log."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = []
+
+    def emit(self, record):
+        rec = json.loads(record.getMessage())
+        if rec["stage"] == "preview_encode": self.seconds.append(rec["seconds"])
+
+def encode_s(hinfo, raster, dpi, fmt, quality, times, repeat):
+    times.seconds.clear()
+    for _ in range(repeat):
+        data = composite_preview(hinfo, raster, MergeConfig(), dpi, fmt, quality)
+    return min(times.seconds), len(data)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--widths", nargs="+", type=int, default=[340, 704, 1400])
+    ap.add_argument("--formats", nargs="+", default=["JPEG:90", "JPEG:80", "JPEG:60", "WEBP:80", "PNG"],
+                    help="FORMAT[:QUALITY]")
+    ap.add_argument("--kinds", nargs="+", choices=KINDS, default=["text", "scanned"])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    times = EncodeTimes()
+    log = logging.getLogger("letterhead.metrics")
+    log.addHandler(times)
+    log.setLevel(logging.INFO)
+
+    hinfo = HeaderCache().analyze(make_header())
+    rasters = ContentRasterCache()
+    print(f"{'kind':<8} {'width':>6} {'dpi':>4} {'format':<8} {'encode ms':>10} {'KiB':>8}")
+    for kind in args.kinds:
+        content = make_content(kind, 1)
+        draft = rasters.render(content, dpi=PREVIEW_DRAFT_DPI)
+        s, n = encode_s(hinfo, draft, PREVIEW_DRAFT_DPI, PREVIEW_FORMAT, DRAFT_QUALITY, times, args.repeat)
+        print(f"{kind:<8} {'draft':>6} {PREVIEW_DRAFT_DPI:>4} {PREVIEW_FORMAT:<8} {s * 1000:10.2f} {n / 1024:8.1f}")
+        for width in args.widths:
+            dpi = preview_dpi(width, hinfo.width)
+            raster = rasters.render(content, dpi=dpi)
+            for spec in args.formats:
+                fmt, _, quality = spec.upper().partition(":")
+                s, n = encode_s(hinfo, raster, dpi, fmt, int(quality or 0), times, args.repeat)
+                print(f"{kind:<8} {width:>6} {dpi:>4} {spec:<8} {s * 1000:10.2f} {n / 1024:8.1f}")
@@ -0,0 +1,66 @@
+"""Compares stamp mode (header drawn into the copied content pages) with
+re-imposition (every page wrapped as a Form XObject on a new page).
+
+Reports merge and save time, output size, and for the shorter documents
+DOCX conversion time and how many of the content's words come back out of
+the DOCX.
+
+Usage: python benchmarks/bench_stamp_mode.py [--pages 50 500] [--kinds text image] [--docx-max-pages 50]
+"""
+import argparse
+import dataclasses
+import io
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import MODE_ALL, HeaderCache, MergeConfig, merge_pdf, open_document, pdf_to_docx
+from synthetic import KINDS, make_content, make_header
+
+def words_kept(content, docx_bytes):
+    """Share of the content's words (as a multiset) found in the DOCX text."""
+    import docx  # python-docx, installed with pdf2docx
+    doc = docx.Document(io.BytesIO(docx_bytes))
+    found = {}
+    for text in [p.text for p in doc.paragraphs] + [c.text for t in doc.tables for r in t.rows for c in r.cells]:
+        for word in text.split(): found[word] = found.get(word, 0) + 1
+    with fitz.open("pdf", content) as d_doc:
+        words = [w[4] for page in d_doc for w in page.get_text("words")]
+    kept = 0
+    for word in words:
+        if found.get(word, 0) > 0:
+            found[word] -= 1
+            kept += 1
+    return kept / max(1, len(words))
+
+def run(kind, pages, stamp, docx_max_pages):
+    content = make_content(kind, pages)
+    hinfo = HeaderCache().analyze(make_header())
+    cfg = dataclasses.replace(MergeConfig(mode=MODE_ALL), stamp=stamp)
+    d_doc = open_document(content)
+    t0 = time.perf_counter()
+    try:
+        merged = merge_pdf(hinfo, d_doc, cfg)
+    finally:
+        d_doc.close()
+    merge_s = time.perf_counter() - t0
+    line = f"{kind:<8} {pages:>5}p  {'stamp' if stamp else 'reimpose':<9} merge+save {merge_s:7.3f}s  size {len(merged) / 1024:9.1f} KiB"
+    if pages <= docx_max_pages:
+        t0 = time.perf_counter()
+        docx_bytes = pdf_to_docx(merged)
+        line += f"  docx {time.perf_counter() - t0:7.2f}s  words kept {words_kept(content, docx_bytes):6.1%}"
+    print(line)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--pages", nargs="+", type=int, default=[50, 500])
+    ap.add_argument("--kinds", nargs="+", choices=KINDS, default=["text", "image"])
+    ap.add_argument("--docx-max-pages", type=int, default=50)
+    args = ap.parse_args()
+    for kind in args.kinds:
+        for pages in args.pages:
+            for stamp in (False, True):
+                run(kind, pages, stamp, args.docx_max_pages)
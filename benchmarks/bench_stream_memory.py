@@ -0,0 +1,70 @@
+"""Peak memory of the in-memory merge vs. the streaming merge_to_file.
+
+Each step runs in a fresh interpreter: Linux carries ru_maxrss across exec, so
+the parent never builds a document itself.
+Usage: python benchmarks/bench_stream_memory.py [pages ...]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from merge_engine import MODE_ALL, MergeConfig, merge_docs, merge_to_file
+
+def make_header():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "SUPER AAI BIO ENERGY PVT LTD", fontsize=24)
+    return doc
+
+def make_scanned_content(path, pages):
+    """Every page carries its own incompressible image, like a scanned statement."""
+    doc = fitz.open()
+    for _ in range(pages):
+        pix = fitz.Pixmap(fitz.csGRAY, 200, 280, os.urandom(200 * 280), 0)
+        doc.new_page().insert_image(fitz.Rect(36, 36, 559, 806), pixmap=pix)
+    doc.save(path)
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def run_child(*args):
+    return subprocess.run([sys.executable, __file__, "--child", *map(str, args)],
+                          capture_output=True, text=True, check=True).stdout.split()
+
+def child(kind, content_path, out_path):
+    if kind == "make":
+        make_scanned_content(out_path, int(content_path))
+        return
+    h_doc, d_doc = make_header(), fitz.open(content_path)
+    cfg = MergeConfig(mode=MODE_ALL)
+    t0 = time.perf_counter()
+    if kind == "stream":
+        merge_to_file(h_doc, d_doc, out_path, cfg)
+    else:
+        out_doc = merge_docs(h_doc, d_doc, cfg)
+        out_doc.save(out_path)
+        out_doc.close()
+    print(f"{peak_rss_mb():.1f} {time.perf_counter() - t0:.2f}")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(*sys.argv[2:5])
+        sys.exit()
+
+    counts = [int(a) for a in sys.argv[1:]] or [250, 500, 1000]
+    print(f"{'pages':>6} {'mode':>7} {'peak RSS MB':>13} {'time s':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in counts:
+            content = os.path.join(tmp, f"content{pages}.pdf")
+            run_child("make", pages, content)
+            for kind in ("memory", "stream"):
+                out = run_child(kind, content, os.path.join(tmp, "out.pdf"))
+                print(f"{pages:>6} {kind:>7} {float(out[-2]):>13.1f} {float(out[-1]):>7.2f}")
@@ -0,0 +1,203 @@
+"""Benchmark suite: header detection, preview, merge (both modes) and DOCX.
+
+Runs every combination of content kind, page count and paper size on
+synthetic documents (see synthetic.py) and reports latency percentiles,
+pages per second and peak RSS per operation. Results are written as JSON;
+with --baseline, any p50 latency or peak RSS growth (peak minus the RSS
+before the operation) that rose by more than --tolerance fails the run
+(exit code 1).
+
+Usage:
+    python benchmarks/bench_suite.py -o results.json
+    python benchmarks/bench_suite.py --pages 1 50 --baseline results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge_engine import (MODE_ALL, MODE_FIRST, ContentRasterCache, HeaderCache, MergeConfig, composite_preview,
+                          get_visible_content_bottom, merge_pdf, open_document, pdf_to_docx)
+from synthetic import KINDS, PAGE_SIZES, make_content, make_header
+
+MIN_REPEAT_PAGES = 200  # aim for at least this many pages timed per operation
+DOCX_REPEAT_PAGES = 50  # pdf2docx is ~100x slower per page, so it gets a smaller budget
+NO_WARM_UP_PAGES = 50  # long documents skip the warm-up run; short cases already paid the imports
+NOISE_MS = 5  # p50 changes smaller than this never count as regressions
+NOISE_MB = 8  # same for the peak RSS growth of one operation
+
+# --- PEAK MEMORY ---
+# Linux lets a process reset its RSS high-water mark (VmHWM), which gives a
+# per-operation peak. Elsewhere ru_maxrss only ever grows, so later
+# operations inherit the peaks of earlier ones.
+
+def _reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _peak_mb():
+    peak = _status_mb("VmHWM:")
+    if peak is not None: return peak
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def _rss_mb():
+    return _status_mb("VmRSS:") or _peak_mb()
+
+# --- OPERATIONS ---
+# Each takes the prepared case and does what the apps do for one request.
+
+def op_header_bottom(case):
+    get_visible_content_bottom(case["h_doc"][0])
+
+def op_preview(case):
+    """Cold generate_preview: both caches empty, as for a fresh upload."""
+    hinfo = HeaderCache().analyze(case["header"])
+    composite_preview(hinfo, ContentRasterCache().render(case["content"]), MergeConfig())
+
+def _merge(case, mode):
+    hinfo = case["hinfo"]
+    d_doc = open_document(case["content"])
+    try:
+        case["merged"] = merge_pdf(hinfo, d_doc, MergeConfig(mode=mode))
+    finally:
+        d_doc.close()
+
+def op_merge_first(case): _merge(case, MODE_FIRST)
+def op_merge_all(case): _merge(case, MODE_ALL)
+
+def op_docx(case):
+    pdf_to_docx(case["merged"])
+
+OPERATIONS = {"header_bottom": op_header_bottom, "preview": op_preview,
+              "merge_first": op_merge_first, "merge_all": op_merge_all, "docx": op_docx}
+PAGE_OPS = ("merge_first", "merge_all", "docx")  # the rest touch a single page
+
+def percentile(sorted_values, q):
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def measure(fn, case, repeat, warm_up=True):
+    if warm_up: fn(case)  # imports, font loading, first-call caches
+    per_op_peak = _reset_peak()
+    base = _rss_mb()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(case)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {"runs": repeat,
+            "p50_ms": round(percentile(times, 0.5) * 1000, 3),
+            "p90_ms": round(percentile(times, 0.9) * 1000, 3),
+            "p99_ms": round(percentile(times, 0.99) * 1000, 3),
+            "mean_ms": round(statistics.fmean(times) * 1000, 3),
+            "base_rss_mb": round(base, 1),
+            "peak_rss_mb": round(_peak_mb(), 1),
+            "peak_rss_growth_mb": round(_peak_mb() - base, 1),
+            "peak_rss_per_op": per_op_peak}
+
+def run_case(kind, pages, size, ops, repeat, docx_max_pages):
+    header = make_header(size)
+    content = make_content(kind, pages, size)
+    case = {"header": header, "content": content, "h_doc": fitz.open("pdf", header),
+            "hinfo": HeaderCache().analyze(header)}
+    results = []
+    for name in ops:
+        if name == "docx":
+            if pages > docx_max_pages: continue
+            if "merged" not in case: op_merge_all(case)
+        budget = DOCX_REPEAT_PAGES if name == "docx" else MIN_REPEAT_PAGES
+        n = repeat if name not in PAGE_OPS else max(1, min(repeat, budget // pages))
+        r = measure(OPERATIONS[name], case, n, warm_up=name not in PAGE_OPS or pages < NO_WARM_UP_PAGES)
+        work = pages if name in PAGE_OPS else 1
+        r.update(case=f"{kind}-{pages}p-{size}", op=name, kind=kind, pages=pages, size=size,
+                 content_bytes=len(content), pages_per_s=round(work / (r["mean_ms"] / 1000), 2))
+        results.append(r)
+        print(f"{r['case']:<20} {name:<14} p50 {r['p50_ms']:>9.1f} ms  p90 {r['p90_ms']:>9.1f} ms  "
+              f"{r['pages_per_s']:>8.1f} pages/s  peak {r['peak_rss_mb']:>7.1f} MB (+{r['peak_rss_growth_mb']:.1f})",
+              file=sys.stderr)
+    case["h_doc"].close()
+    fitz.TOOLS.store_shrink(100)  # start the next case with an empty MuPDF resource store
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit, "python": platform.python_version(), "pymupdf": fitz.VersionBind,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def compare(results, baseline, tolerance):
+    """Returns one message per (case, op) that got slower or bigger than the baseline allows."""
+    old = {(r["case"], r["op"]): r for r in baseline["results"]}
+    failures = []
+    for r in results:
+        b = old.get((r["case"], r["op"]))
+        if b is None: continue
+        if r["p50_ms"] > b["p50_ms"] * (1 + tolerance) and r["p50_ms"] - b["p50_ms"] > NOISE_MS:
+            failures.append(f"{r['case']} {r['op']}: p50 {b['p50_ms']:.1f} -> {r['p50_ms']:.1f} ms")
+        grew, was = r["peak_rss_growth_mb"], b["peak_rss_growth_mb"]
+        if r["peak_rss_per_op"] and b["peak_rss_per_op"] and grew > was * (1 + tolerance) and grew - was > NOISE_MB:
+            failures.append(f"{r['case']} {r['op']}: peak RSS growth {was:.1f} -> {grew:.1f} MB")
+    return failures
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Letterhead merge benchmark suite.")
+    ap.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    ap.add_argument("--pages", nargs="+", type=int, default=[1, 50, 500])
+    ap.add_argument("--sizes", nargs="+", choices=list(PAGE_SIZES), default=list(PAGE_SIZES))
+    ap.add_argument("--ops", nargs="+", choices=list(OPERATIONS), default=list(OPERATIONS))
+    ap.add_argument("--repeat", type=int, default=10, help="timed runs per operation (fewer for long documents)")
+    ap.add_argument("--docx-max-pages", type=int, default=50, help="skip DOCX for longer documents")
+    ap.add_argument("-o", "--out", help="write results to this JSON file")
+    ap.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (0.25 = 25%%)")
+    args = ap.parse_args(argv)
+
+    results = []
+    for kind in args.kinds:
+        for pages in args.pages:
+            for size in args.sizes:
+                results += run_case(kind, pages, size, args.ops, args.repeat, args.docx_max_pages)
+
+    report = {"environment": environment(), "settings": vars(args), "results": results}
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        for msg in failures:
+            print(f"REGRESSION {msg}", file=sys.stderr)
+        if failures: return 1
+        print("No regressions.", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
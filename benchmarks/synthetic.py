@@ -0,0 +1,104 @@
+"""Deterministic synthetic letterheads and content PDFs for the benchmarks.
+
+Same arguments, same bytes: every random choice comes from a seeded
+random.Random, and documents are saved without timestamps.
+"""
+import random
+
+import fitz  # PyMuPDF
+
+PAGE_SIZES = {"A4": fitz.paper_size("a4"), "Letter": fitz.paper_size("letter")}
+KINDS = ("text", "image", "scanned")
+
+def _save(doc):
+    doc.set_metadata({})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return data
+
+def _pixmap(rng, w, h, gray=False):
+    """Noise image: incompressible like a photo or a scan."""
+    cs, n = (fitz.csGRAY, 1) if gray else (fitz.csRGB, 3)
+    return fitz.Pixmap(cs, w, h, rng.randbytes(w * h * n), 0)
+
+def make_header(size="A4", seed=0):
+    """Letterhead: company name, logo image, address line and a rule, all in the top ~20%."""
+    rng = random.Random(seed)
+    w, h = PAGE_SIZES[size]
+    doc = fitz.open()
+    page = doc.new_page(width=w, height=h)
+    page.insert_image(fitz.Rect(40, 30, 120, 110), pixmap=_pixmap(rng, 160, 160))
+    page.insert_text((135, 65), "SUPER AAI BIO ENERGY PVT LTD", fontsize=22)
+    page.insert_text((135, 90), "Plot 12, MIDC Area, Pune 411019  |  +91 20 5555 0100", fontsize=9)
+    page.draw_rect(fitz.Rect(40, 120, w - 40, 122), color=(0, 0.3, 0.1), fill=(0, 0.3, 0.1))
+    return _save(doc)
+
+LETTERHEAD_STYLES = ("simple", "vector_logo", "many_images", "word_export", "scanned")
+
+def _vector_logo(page, rng, x, y, curves=1500):
+    """A traced logo: hundreds of small filled bezier shapes, like an SVG exported to PDF."""
+    shape = page.new_shape()
+    for _ in range(curves):
+        cx, cy = x + rng.uniform(0, 80), y + rng.uniform(0, 80)
+        shape.draw_bezier((cx, cy), (cx + rng.uniform(-6, 6), cy - 5), (cx + 5, cy + rng.uniform(-6, 6)), (cx + 3, cy + 3))
+        shape.finish(color=None, fill=(rng.random() * 0.3, 0.4, 0.2), closePath=True)
+    shape.commit()
+
+def make_letterhead(style="simple", size="A4", seed=0):
+    """Letterheads built the way real ones come out of design tools.
+
+    simple: make_header(). vector_logo: a traced logo of 1500 bezier fills.
+    many_images: a row of 24 small partner/certification badges.
+    word_export: white full-page background, header, and a footer address line.
+    scanned: the whole letterhead is one page-sized image.
+    """
+    if style == "simple":
+        return make_header(size, seed)
+    rng = random.Random(seed)
+    w, h = PAGE_SIZES[size]
+    doc = fitz.open()
+    page = doc.new_page(width=w, height=h)
+    if style == "scanned":
+        pix = _pixmap(rng, 620, 877, gray=True)
+        pix.set_rect(fitz.IRect(0, 180, 620, 877), (255,))  # blank paper below the letterhead
+        page.insert_image(page.rect, pixmap=pix)
+        return _save(doc)
+    if style == "word_export":
+        page.draw_rect(page.rect, color=None, fill=(1, 1, 1))
+        page.insert_text((72, h - 40), "Regd. office: Plot 12, MIDC Area, Pune 411019  |  CIN U40100PN2015PTC000000", fontsize=8)
+    if style == "vector_logo":
+        _vector_logo(page, rng, 40, 30)
+    if style == "many_images":
+        for i in range(24):
+            page.insert_image(fitz.Rect(40 + i * 21, 100, 58 + i * 21, 118), pixmap=_pixmap(rng, 48, 48))
+    page.insert_text((135, 65), "SUPER AAI BIO ENERGY PVT LTD", fontsize=22)
+    page.insert_text((135, 90), "Plot 12, MIDC Area, Pune 411019  |  +91 20 5555 0100", fontsize=9)
+    page.draw_rect(fitz.Rect(40, 125, w - 40, 127), color=(0, 0.3, 0.1), fill=(0, 0.3, 0.1))
+    return _save(doc)
+
+def _text_page(page, rng, pno):
+    page.insert_text((72, 80), f"Statement page {pno + 1}", fontsize=14)
+    rows = [f"{row + 1:>3}  Lorem ipsum dolor sit amet  {rng.uniform(10, 99999):>12.2f}" for row in range(32)]
+    page.insert_text((72, 110), "\n".join(rows), fontsize=10, lineheight=2)
+
+def _image_page(page, rng, pno):
+    page.insert_text((72, 80), f"Site photos, page {pno + 1}", fontsize=14)
+    for i in range(4):
+        x, y = 72 + (i % 2) * 230, 110 + (i // 2) * 250
+        page.insert_image(fitz.Rect(x, y, x + 220, y + 165), pixmap=_pixmap(rng, 120, 90))
+        page.insert_text((x, y + 185), f"Figure {pno * 4 + i + 1}", fontsize=9)
+
+def _scanned_page(page, rng, pno):
+    r = page.rect
+    page.insert_image(fitz.Rect(18, 18, r.width - 18, r.height - 18), pixmap=_pixmap(rng, 200, 280, gray=True))
+
+_PAGE_MAKERS = {"text": _text_page, "image": _image_page, "scanned": _scanned_page}
+
+def make_content(kind="text", pages=1, size="A4", seed=1):
+    """Content PDF bytes: "text" (tables of text), "image" (photo grid) or "scanned" (one page image)."""
+    rng = random.Random(seed)
+    w, h = PAGE_SIZES[size]
+    doc = fitz.open()
+    for pno in range(pages):
+        _PAGE_MAKERS[kind](doc.new_page(width=w, height=h), rng, pno)
+    return _save(doc)
@@ -0,0 +1,136 @@
+"""Process-wide queue for merge jobs.
+
+Every Streamlit session shares one JobScheduler (see get_scheduler in the
+apps). It runs at most `workers` jobs at a time and serves users round
+robin: a user with ten queued jobs does not hold up someone who just
+clicked once. Each job has an estimated cost in seconds (job_cost); once
+the admitted work (queued, running, and Word conversions still going
+through track()) would exceed `max_backlog` seconds, new jobs are turned
+away with Overloaded instead of queueing behind a wait nobody sits through.
+Cancelling a queued job takes it off the queue and the backlog at once.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+MERGE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+MERGE_PAGE_SECONDS = 0.01  # rough per-page cost of stamping and saving
+DOCX_PAGE_SECONDS = 0.35   # rough per-page cost of pdf2docx
+MAX_BACKLOG_SECONDS = 300
+
+def job_cost(pages, merge=True, docx=False):
+    """Estimated seconds of work for a job over `pages` pages."""
+    return max(1, pages) * (MERGE_PAGE_SECONDS * merge + DOCX_PAGE_SECONDS * docx)
+
+class Overloaded(RuntimeError):
+    """Raised by submit() when the server already has more work admitted than it should."""
+
+class Job(Future):
+    def __init__(self, scheduler, user, cost, fn, args, kwargs):
+        super().__init__()
+        self.user, self.cost = user, cost
+        self._scheduler = scheduler
+        self._call = (fn, args, kwargs)
+
+    def cancel(self):
+        """Cancels a job that has not started and takes it off the queue at once."""
+        cancelled = super().cancel()
+        if cancelled: self._scheduler._drop(self)
+        return cancelled
+
+class JobScheduler:
+    """Bounded, fair worker pool with admission control by estimated cost."""
+
+    def __init__(self, workers=MERGE_WORKERS, max_backlog=MAX_BACKLOG_SECONDS):
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self._queues = OrderedDict()  # user -> deque of Jobs; the first user is served next
+        self._backlog = 0.0
+        self._cond = threading.Condition()
+        self._threads = []
+
+    @property
+    def backlog(self):
+        """Estimated seconds of admitted work not finished yet."""
+        return self._backlog
+
+    def submit(self, user, cost, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) for `user` and returns its Job (a Future).
+
+        Raises Overloaded if the backlog would exceed max_backlog. A job is
+        always admitted onto an idle server, however big it is.
+        """
+        with self._cond:
+            if self._backlog and self._backlog + cost > self.max_backlog:
+                raise Overloaded(f"Server busy: about {self._backlog:.0f}s of work queued. Please try again shortly.")
+            job = Job(self, user, cost, fn, args, kwargs)
+            self._queues.setdefault(user, deque()).append(job)
+            self._backlog += cost
+            self._start_workers()
+            self._cond.notify()
+        return job
+
+    def track(self, future, cost):
+        """Counts work done elsewhere (a Word conversion) against the backlog until `future` finishes."""
+        with self._cond:
+            self._backlog += cost
+        future.add_done_callback(lambda f: self._release(cost))
+
+    def position(self, job):
+        """Place of `job` in the queue: 1 if it starts next, 0 once it is running or done."""
+        with self._cond:
+            mine = self._queues.get(job.user)
+            if not mine or job not in mine: return 0
+            k = mine.index(job)
+            ahead, before = k, True
+            for user, q in self._queues.items():
+                if user == job.user:
+                    before = False
+                    continue
+                ahead += min(len(q), k + 1 if before else k)
+            return ahead + 1
+
+    def _release(self, cost):
+        with self._cond:
+            self._backlog = max(0.0, self._backlog - cost)
+
+    def _drop(self, job):
+        """Removes a cancelled job still waiting in its user's queue; a worker that already took it releases it."""
+        with self._cond:
+            q = self._queues.get(job.user)
+            if not q or job not in q: return
+            q.remove(job)
+            if not q: del self._queues[job.user]
+            self._backlog = max(0.0, self._backlog - job.cost)
+
+    def _start_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f"merge-worker-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _next(self):
+        user, q = next(iter(self._queues.items()))
+        job = q.popleft()
+        del self._queues[user]
+        if q: self._queues[user] = q  # back of the line for this user's next job
+        return job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queues:
+                    self._cond.wait()
+                job = self._next()
+                started = job.set_running_or_notify_cancel()  # under the lock, so position() never sees it in between
+            try:
+                if not started: continue
+                fn, args, kwargs = job._call
+                try:
+                    job.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    job.set_exception(e)
+            finally:
+                self._release(job.cost)
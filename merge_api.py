@@ -0,0 +1,368 @@
+"""Local HTTP API for the letterhead merge, next to the Streamlit UI.
+
+    python merge_api.py [--host 127.0.0.1] [--port 8765] [--workers N]
+
+Endpoints:
+
+  POST /header   body: letterhead PDF/PNG/JPEG -> {"key", "width", "height", "bottom"}
+  POST /merge    multipart "header" + "content" files, or a raw content body
+                 with ?header=<key> from /header                -> PDF (or DOCX)
+  POST /preview  same inputs as /merge                            -> image of page 1
+  POST /convert  PDF as raw body or multipart "pdf"               -> DOCX
+  GET  /metrics  Prometheus text of this process's stage timings
+
+Settings go in the query string or as multipart fields: mode=first|all,
+y_offset, header_scale, standard=1, layout=fit|flow, stamp=0 and, for
+/merge, format=pdf|docx. /preview takes width (display pixels; sets the
+dpi), format=jpeg|webp|png, quality, and draft=1 for a quick low-res image
+to show while the sharp one loads. Raw bodies use their Content-Type
+(application/pdf, image/png, image/jpeg).
+
+Uploads are written to temp files as they arrive and hashed on the way, so
+identical merges are answered from the result cache without any work.
+Merges and previews run in a process pool, Word conversion in the shared
+DOCX pool, and result cache access and whole-file reads in threads; the
+event loop only moves bytes. Responses are streamed from disk in
+CHUNK_BYTES pieces. With more than MAX_PENDING requests in flight, new
+ones get 503.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from job_scheduler import MERGE_WORKERS
+from merge_engine import (DRAFT_QUALITY, IMAGE_TYPES, LAYOUT_FIT, LAYOUT_FLOW, MODE_ALL, MODE_FIRST, PREVIEW_DPI,
+                          PREVIEW_DRAFT_DPI, PREVIEW_FORMATS, PREVIEW_QUALITY, HeaderCache, LRUCache, MergeConfig,
+                          composite_preview, file_type, merge_to_file, open_document, preview_dpi,
+                          render_content_raster, shutdown_docx_pool, submit_docx)
+from pipeline_metrics import prometheus_text, timed
+from result_cache import ResultCache, content_hash, result_key
+
+CHUNK_BYTES = 256 * 1024
+MAX_PENDING = 64
+CONTENT_TYPES = {"application/pdf": "pdf", "image/png": "png", "image/jpeg": "jpg"}
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# --- WORKERS ---
+# Run in the API's process pool; each worker keeps its own letterhead cache.
+
+_headers = HeaderCache(max_entries=8)
+
+def _worker(fn):
+    """MuPDF's own exceptions (a corrupt PNG raises FzErrorFormat) cannot be pickled back to
+    the server; they are re-raised as FileDataError, which _run turns into a 422."""
+    @functools.wraps(fn)
+    def wrapper(*args):
+        try:
+            return fn(*args)
+        except fitz.mupdf.FzErrorBase as e:
+            raise fitz.FileDataError(str(e)) from None
+    return wrapper
+
+def _open_content(path, filetype):
+    if filetype in IMAGE_TYPES:
+        with open(path, "rb") as f: return open_document(f.read(), filetype)
+    return fitz.open(path, filetype="pdf")
+
+@_worker
+def merge_worker(header, header_type, content_path, content_type, cfg, out_path):
+    """Merges into out_path; returns its size."""
+    hinfo = _headers.analyze(header, header_type)
+    with _open_content(content_path, content_type) as d_doc:
+        merge_to_file(hinfo.doc, d_doc, out_path, cfg, hinfo.bottom, workers=1)
+    return os.path.getsize(out_path)
+
+@_worker
+def preview_worker(header, header_type, content_path, content_type, cfg, opts):
+    """Preview image of the first merged page (see preview_options)."""
+    hinfo = _headers.analyze(header, header_type)
+    if opts["draft"]: dpi, quality = PREVIEW_DRAFT_DPI, DRAFT_QUALITY
+    else: dpi, quality = preview_dpi(opts["width"], hinfo.width) if opts["width"] else PREVIEW_DPI, opts["quality"]
+    with _open_content(content_path, content_type) as d_doc:
+        return composite_preview(hinfo, render_content_raster(d_doc, 0, dpi), cfg, dpi, opts["format"], quality)
+
+@_worker
+def header_worker(header, header_type):
+    hinfo = _headers.analyze(header, header_type)
+    return {"width": hinfo.width, "height": hinfo.height, "bottom": hinfo.bottom}
+
+# --- REQUEST INPUT ---
+
+@dataclass
+class Upload:
+    path: str  # temp file, removed by the request handler
+    sha256: str
+    filetype: str
+
+@dataclass
+class Letterhead:
+    data: bytes
+    filetype: str
+    sha256: str
+    nbytes: int
+
+async def _spool(chunks):
+    """Writes an async stream of byte chunks to a temp file, hashing on the way."""
+    h = hashlib.sha256()
+    fd, path = tempfile.mkstemp(prefix="letterhead-api-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                h.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, h.hexdigest()
+
+async def _upload_chunks(upload):
+    while chunk := await upload.read(CHUNK_BYTES):
+        yield chunk
+
+def _filetype(name, mime):
+    ft = file_type(name) if name else CONTENT_TYPES.get((mime or "").split(";")[0].strip())
+    if ft not in IMAGE_TYPES + ("pdf",):
+        raise HTTPException(415, f"Unsupported file type {name or mime!r}; send a PDF, PNG or JPEG.")
+    return ft
+
+async def read_inputs(request, names):
+    """The uploads named in `names` plus the settings, from a multipart form or a raw body.
+
+    A raw body is the last name in `names`; the others must then come from
+    /header (only "header" can). Returns ({name: Upload or Letterhead}, params).
+    """
+    params = dict(request.query_params)
+    inputs = {}
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            async with request.form() as form:
+                for name in names:
+                    upload = form.get(name)
+                    if upload is None or isinstance(upload, str):
+                        raise HTTPException(400, f"Missing file field {name!r}.")
+                    ft = _filetype(upload.filename, upload.content_type)
+                    inputs[name] = Upload(*await _spool(_upload_chunks(upload)), ft)
+                params.update({k: v for k, v in form.items() if isinstance(v, str)})
+        else:
+            *others, last = names
+            for name in others:
+                inputs[name] = _letterheads.get(params.get(name, ""))
+                if inputs[name] is None:
+                    raise HTTPException(400, f"Unknown {name} key; POST it to /{name} first or send multipart.")
+            ft = _filetype(None, request.headers.get("content-type"))
+            inputs[last] = Upload(*await _spool(request.stream()), ft)
+    except BaseException:
+        _cleanup(inputs)
+        raise
+    return inputs, params
+
+def _cleanup(inputs):
+    for value in inputs.values():
+        if isinstance(value, Upload):
+            try: os.remove(value.path)
+            except OSError: pass
+
+def _read(path):
+    with open(path, "rb") as f: return f.read()
+
+async def _letterhead(value):
+    """(bytes, filetype, sha256) of a letterhead input."""
+    if isinstance(value, Letterhead):
+        return value.data, value.filetype, value.sha256
+    return await asyncio.to_thread(_read, value.path), value.filetype, value.sha256
+
+def merge_config(params):
+    """MergeConfig from request settings; 400 on bad values."""
+    try:
+        mode = {"first": MODE_FIRST, "all": MODE_ALL}[params.get("mode", "first")]
+        layout = {"fit": LAYOUT_FIT, "flow": LAYOUT_FLOW}[params.get("layout", "fit")]
+        y_offset, header_scale = float(params.get("y_offset", 0)), float(params.get("header_scale", 100))
+    except (KeyError, ValueError):
+        raise HTTPException(400, "Bad settings: mode=first|all, layout=fit|flow, y_offset and header_scale numbers.")
+    if not math.isfinite(y_offset):
+        raise HTTPException(400, "y_offset must be a finite number of points.")
+    if not (math.isfinite(header_scale) and header_scale > 0):
+        raise HTTPException(400, "header_scale must be a percentage above 0.")
+    return MergeConfig(mode=mode, y_offset=y_offset, header_scale=header_scale,
+                       use_standard=params.get("standard", "0") == "1", layout=layout,
+                       stamp=params.get("stamp", "1") != "0")
+
+def preview_options(params):
+    """Display width, format, quality and draft flag of a /preview request; 400 on bad values."""
+    try:
+        opts = {"width": int(params.get("width", 0)), "format": params.get("format", "jpeg").upper(),
+                "quality": int(params.get("quality", PREVIEW_QUALITY)), "draft": params.get("draft", "0") == "1"}
+        if opts["format"] in PREVIEW_FORMATS and 1 <= opts["quality"] <= 100 and opts["width"] >= 0: return opts
+    except ValueError:
+        pass
+    raise HTTPException(400, "Bad preview settings: width pixels, format=jpeg|webp|png, quality 1-100.")
+
+# --- RESPONSES ---
+
+def _stream_file(path, media_type, filename, remove=True):
+    def chunks():
+        try:
+            with open(path, "rb") as f:
+                while chunk := f.read(CHUNK_BYTES):
+                    yield chunk
+        finally:
+            if remove: os.remove(path)
+    return StreamingResponse(chunks(), media_type=media_type, headers={
+        "Content-Length": str(os.path.getsize(path)), "Content-Disposition": f'attachment; filename="{filename}"'})
+
+def _stream_bytes(data, media_type, filename):
+    return StreamingResponse((data[i:i + CHUNK_BYTES] for i in range(0, len(data), CHUNK_BYTES)),
+                             media_type=media_type, headers={
+        "Content-Length": str(len(data)), "Content-Disposition": f'attachment; filename="{filename}"'})
+
+async def _run(fn, *args):
+    """Runs fn in the process pool; engine errors become 422."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+    except ValueError as e:  # layout errors ("Header leaves no room...")
+        raise HTTPException(422, str(e))
+    except fitz.FileDataError:
+        raise HTTPException(422, "Could not read files. Ensure they are valid PDF or images.")
+
+async def _docx(pdf):
+    """DOCX bytes for a PDF through the result cache and the shared DOCX pool."""
+    try:
+        job = await asyncio.to_thread(_results.job, content_hash(pdf), "docx", lambda: submit_docx(pdf))
+        return await asyncio.wrap_future(job)
+    except Exception as e:
+        raise HTTPException(422, f"Word conversion failed: {e}")
+
+# --- ENDPOINTS ---
+
+_pending = [0]
+
+def limited(handler):
+    """503 once MAX_PENDING requests are in flight, instead of an ever longer queue."""
+    async def wrapper(request):
+        if _pending[0] >= MAX_PENDING:
+            return JSONResponse({"error": "Server busy, try again shortly."}, 503)
+        _pending[0] += 1
+        try:
+            with timed("api", path=request.url.path):
+                return await handler(request)
+        finally:
+            _pending[0] -= 1
+    return wrapper
+
+@limited
+async def post_header(request):
+    inputs, _ = await read_inputs(request, ["header"])
+    try:
+        data, ft, key = await _letterhead(inputs["header"])
+    finally:
+        _cleanup(inputs)
+    info = await _run(header_worker, data, ft)
+    _letterheads.put(key, Letterhead(data, ft, key, len(data)))
+    return JSONResponse({"key": key, **info})
+
+@limited
+async def post_merge(request):
+    inputs, params = await read_inputs(request, ["header", "content"])
+    try:
+        cfg = merge_config(params)
+        fmt = params.get("format", "pdf")
+        if fmt not in ("pdf", "docx"): raise HTTPException(400, "format must be pdf or docx.")
+        header, header_type, header_sha = await _letterhead(inputs["header"])
+        content = inputs["content"]
+        key = result_key(header_sha, content.sha256, cfg)
+        pdf = await asyncio.to_thread(_results.get, key, "pdf")
+        if pdf is None:
+            fd, out_path = tempfile.mkstemp(prefix="letterhead-api-", suffix=".pdf")
+            os.close(fd)
+            try:
+                await _run(merge_worker, header, header_type, content.path, content.filetype, cfg, out_path)
+            except BaseException:
+                os.remove(out_path)
+                raise
+            await asyncio.to_thread(_results.put_file, key, "pdf", out_path)
+            if fmt == "pdf": return _stream_file(out_path, PDF_MIME, "merged.pdf")
+            pdf = await asyncio.to_thread(_read, out_path)
+            os.remove(out_path)
+        if fmt == "pdf": return _stream_bytes(pdf, PDF_MIME, "merged.pdf")
+        return _stream_bytes(await _docx(pdf), DOCX_MIME, "merged.docx")
+    finally:
+        _cleanup(inputs)
+
+@limited
+async def post_preview(request):
+    inputs, params = await read_inputs(request, ["header", "content"])
+    try:
+        cfg, opts = merge_config(params), preview_options(params)
+        header, header_type, _ = await _letterhead(inputs["header"])
+        content = inputs["content"]
+        image = await _run(preview_worker, header, header_type, content.path, content.filetype, cfg, opts)
+    finally:
+        _cleanup(inputs)
+    return Response(image, media_type=f"image/{opts['format'].lower()}")
+
+@limited
+async def post_convert(request):
+    inputs, _ = await read_inputs(request, ["pdf"])
+    try:
+        if inputs["pdf"].filetype != "pdf": raise HTTPException(415, "Send a PDF.")
+        pdf = await asyncio.to_thread(_read, inputs["pdf"].path)
+    finally:
+        _cleanup(inputs)
+    return _stream_bytes(await _docx(pdf), DOCX_MIME, "converted.docx")
+
+async def get_metrics(request):
+    return PlainTextResponse(prometheus_text())
+
+async def _http_error(request, exc):
+    return JSONResponse({"error": exc.detail}, exc.status_code)
+
+_pool = None
+_results = None
+_letterheads = LRUCache(max_entries=32, max_bytes=128 * 1024 * 1024)  # /header uploads by SHA-256
+
+@contextlib.asynccontextmanager
+async def _lifespan(app):
+    yield
+    _pool.shutdown(cancel_futures=True)
+    shutdown_docx_pool()
+
+def create_app(workers=MERGE_WORKERS, cache_dir=None):
+    """The ASGI app; starts its process pool (spawned, so workers never fork the server)."""
+    global _pool, _results
+    _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    _results = ResultCache(cache_dir)
+    return Starlette(routes=[
+        Route("/header", post_header, methods=["POST"]),
+        Route("/merge", post_merge, methods=["POST"]),
+        Route("/preview", post_preview, methods=["POST"]),
+        Route("/convert", post_convert, methods=["POST"]),
+        Route("/metrics", get_metrics),
+    ], exception_handlers={HTTPException: _http_error}, lifespan=_lifespan)
+
+def main(argv=None):
+    import uvicorn
+    ap = argparse.ArgumentParser(description="Local HTTP API for letterhead merges.")
+    ap.add_argument("--host", default="127.0.0.1", help="interface to listen on (default: local only)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=MERGE_WORKERS, help="merge/preview worker processes")
+    ap.add_argument("--cache-dir", help="result cache directory (default: LETTERHEAD_CACHE_DIR or ~/.cache/letterhead)")
+    args = ap.parse_args(argv)
+    uvicorn.run(create_app(args.workers, args.cache_dir), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1137 @@
+"""Letterhead merge engine shared by the Streamlit apps, the CLI and workers.
+
+Only PyMuPDF is imported up front; Pillow and pdf2docx are imported where
+they are used, so worker processes and batch_merge.py start quickly and
+never import Streamlit.
+"""
+import contextlib
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+
+from pipeline_metrics import timed
+
+# --- HEADER ANALYSIS ---
+
+BACKGROUND_COVER = 0.9  # anything covering this much of both page sides is a background
+BOTTOM_FLAGS = fitz.TEXT_PRESERVE_IMAGES | fitz.TEXT_COLLECT_VECTORS | fitz.TEXT_MEDIABOX_CLIP
+
+BOTTOM_VECTOR, BOTTOM_RASTER, BOTTOM_AUTO = "vector", "raster", "auto"
+BOTTOM_MODES = (BOTTOM_AUTO, BOTTOM_VECTOR, BOTTOM_RASTER)
+BOTTOM_DPI = 36  # raster mode: 1/2 pt rows, about 300 x 420 pixels for A4
+INK_CONTRAST = 40  # raster mode: this much darker than the paper counts as ink
+INK_ROW_SHARE = 0.005  # raster mode: ...in at least this share of a row (ignores dust)
+
+def _scan_blocks(page):
+    """Returns (lowest content y or 0, whether a page-sized image was skipped)."""
+    width, height = page.rect.width, page.rect.height
+    min_w, min_h = width * BACKGROUND_COVER, height * BACKGROUND_COVER
+    max_y, page_image = 0, False
+    for x0, y0, x1, y1, _, _, kind in page.get_textpage(flags=BOTTOM_FLAGS).extractBLOCKS():
+        if y1 <= max_y: continue
+        if y0 >= height or x0 >= width or x1 <= 0: continue  # off the page
+        if x1 - x0 >= min_w and y1 - y0 >= min_h:
+            page_image = page_image or kind == 1
+            continue
+        max_y = min(y1, height)
+        if max_y == height: break
+    return max_y, page_image
+
+def get_visible_content_bottom(page):
+    """Finds the lowest point of content on a PDF page.
+
+    A single text-device pass that also collects image and vector-drawing
+    blocks, so text, images and drawings are all covered. Page-sized
+    backgrounds and frames are skipped. The scan stops early once
+    something reaches the bottom edge.
+    """
+    try: max_y = _scan_blocks(page)[0]
+    except: max_y = 0
+    if max_y == 0: return page.rect.height * 0.15
+    return max_y
+
+def raster_bottom(pix, page_height):
+    """Lowest inked row of a rendered page, in page points (0 if the page is blank).
+
+    Works on any pixmap (gray or RGB): the paper level is taken from the
+    brightest quarter of pixels, so grey scanner backgrounds still count
+    as blank.
+    """
+    import numpy as np
+    rows = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    rows = rows[:, :pix.width * pix.n]
+    if pix.n > 1:
+        rows = rows.reshape(pix.height, pix.width, pix.n)[:, :, :3].min(axis=2)
+    paper = np.percentile(rows, 75)
+    ink_per_row = np.count_nonzero(rows < paper - INK_CONTRAST, axis=1)
+    inked = np.flatnonzero(ink_per_row >= max(1, INK_ROW_SHARE * pix.width))
+    if not inked.size: return 0
+    return min(page_height, float(inked[-1] + 1) * page_height / pix.height)
+
+def get_raster_content_bottom(page, dpi=BOTTOM_DPI):
+    """Content bottom from the pixels: renders a low-DPI grayscale pixmap and finds the last inked row.
+
+    Sees what vector analysis cannot, such as a letterhead that is one scanned image.
+    """
+    try: max_y = raster_bottom(page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False), page.rect.height)
+    except: max_y = 0
+    if max_y == 0: return page.rect.height * 0.15
+    return max_y
+
+def find_content_bottom(page, mode=BOTTOM_AUTO, pix=None):
+    """Content bottom by `mode`: vector, raster, or auto.
+
+    Auto uses the vector scan unless the page carries a page-sized image
+    (a scan, or a letterhead uploaded as PNG/JPG); then it reads the pixels.
+    An already rendered `pix` of the page is reused by raster mode.
+    """
+    if mode != BOTTOM_RASTER:
+        try: max_y, page_image = _scan_blocks(page)
+        except: max_y, page_image = 0, False
+        if mode == BOTTOM_VECTOR or not page_image:
+            return max_y or page.rect.height * 0.15
+    if pix is None:
+        return get_raster_content_bottom(page)
+    return raster_bottom(pix, page.rect.height) or page.rect.height * 0.15
+
+# --- OPENING FILES ---
+
+IMAGE_TYPES = ("png", "jpg", "jpeg")
+SPILL_BYTES = 64 * 1024 * 1024  # uploads above this are parsed from a temp file instead
+
+def file_type(name):
+    """'Letter.PNG' -> 'png'."""
+    return os.path.splitext(name)[1].lower().lstrip(".") or "pdf"
+
+IMAGE_DPI = 200  # images sharper than this at their printed size are downscaled; None keeps every pixel
+IMAGE_PRINT_PT = 842  # printed size assumed for an image's long side at most (A4 height)
+IMAGE_JPEG_QUALITY = 85
+
+@dataclass
+class ImagePdf:
+    data: bytes
+    nbytes: int
+
+def _downscale(data, rect, dpi):
+    """The image re-encoded at `dpi` for its printed size, or None if it is not sharper than that.
+
+    JPEGs stay JPEG (at IMAGE_JPEG_QUALITY, decoded at a reduced scale
+    where possible); everything else becomes PNG, keeping transparency.
+    """
+    from PIL import Image, ImageOps
+    im = Image.open(io.BytesIO(data))
+    limit = dpi / 72 * min(max(rect.width, rect.height), IMAGE_PRINT_PT)
+    if max(im.size) <= limit: return None
+    k = limit / max(im.size)
+    fmt = im.format
+    im.draft(im.mode, (round(im.width * k), round(im.height * k)))  # JPEG: let the decoder skip detail we would throw away
+    # `rect` is already upright; the output carries no EXIF, so turn the pixels instead
+    im = ImageOps.exif_transpose(im)
+    k = limit / max(im.size)
+    size = (max(1, round(im.width * k)), max(1, round(im.height * k)))
+    if im.mode not in ("L", "RGB", "RGBA", "CMYK"):
+        im = im.convert("RGBA" if "transparency" in im.info or "A" in im.mode else "RGB")
+    im = im.resize(size, Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "JPEG" and im.mode != "RGBA":
+        im.save(out, "JPEG", quality=IMAGE_JPEG_QUALITY)
+    else:
+        im.save(out, "PNG")
+    return out.getvalue()
+
+def image_to_pdf(data, filetype, dpi=IMAGE_DPI):
+    """One-page PDF bytes for an image, cached by the image's SHA-256.
+
+    The page keeps the image's own size; with `dpi`, the pixels on it are
+    downscaled to that resolution first (see _downscale), so a phone photo
+    does not put megabytes on every merged page.
+    """
+    key = f"{hashlib.sha256(data).hexdigest()}:{dpi}"
+    cached = _image_pdfs.get(key)
+    if cached is not None: return cached.data
+    with timed("image_convert", len(data), filetype=filetype) as rec:
+        with fitz.open(stream=data, filetype=filetype) as img_doc:
+            rect = img_doc[0].rect
+            small = _downscale(data, rect, dpi) if dpi else None
+            if small is None:
+                pdf_bytes = img_doc.convert_to_pdf()
+            else:
+                with fitz.open() as doc:
+                    doc.new_page(width=rect.width, height=rect.height).insert_image(rect, stream=small)
+                    pdf_bytes = doc.tobytes(deflate=True)
+        rec.update(pdf_bytes=len(pdf_bytes), downscaled=small is not None)
+    return _image_pdfs.put(key, ImagePdf(pdf_bytes, len(pdf_bytes))).data
+
+def open_document(data, filetype="pdf"):
+    """Opens PDF or image bytes as a PDF document (images become a one-page PDF, see image_to_pdf)."""
+    with timed("open", len(data), filetype=filetype):
+        if filetype in IMAGE_TYPES:
+            return fitz.open("pdf", image_to_pdf(bytes(data), filetype))
+        return fitz.open(stream=data, filetype=filetype)
+
+def page_count(data, filetype="pdf"):
+    """Pages in a PDF (images are one page) for cost estimates; 1 if it cannot be read, so opening reports the error."""
+    if filetype in IMAGE_TYPES: return 1
+    try:
+        with fitz.open(stream=data, filetype=filetype) as doc: return doc.page_count
+    except Exception:
+        return 1
+
+def open_upload(uploaded_file, filetype="pdf"):
+    """Opens an uploaded file straight from its buffer (no disk round-trip).
+
+    Very large uploads are spilled to a temp file so MuPDF can read them
+    lazily; the file is unlinked right away and lives until the doc closes.
+    """
+    buf = uploaded_file.getbuffer()
+    if buf.nbytes <= SPILL_BYTES or filetype in IMAGE_TYPES:
+        return open_document(buf, filetype)
+
+    t = tempfile.NamedTemporaryFile(delete=False, suffix=f".{filetype}")
+    try:
+        with timed("spill", buf.nbytes): t.write(buf); t.close()
+        with timed("open", buf.nbytes, filetype=filetype): return fitz.open(t.name)
+    finally:
+        try: os.remove(t.name)
+        except: pass
+
+# --- SHARED LETTERHEAD XOBJECT ---
+
+HEADER_NAME = "fzHdr"
+
+@dataclass
+class SharedHeader:
+    """The letterhead objects of one output document, shared by all stamped pages."""
+    xobj_xref: int  # the placed Form XObject
+    contents_xref: int  # "q /fzHdr Do Q"
+    wraps: dict  # overlay geometry -> (prefix xref, suffix xref), see overlay_header
+
+def build_shared_header(out_doc, h_doc, w, h, rect):
+    """Embeds page 1 of the letterhead into out_doc once.
+
+    Returns the placed Form XObject and a one-line content stream that
+    draws it. Every stamped page points at these objects instead of
+    getting its own copy.
+    """
+    # Let PyMuPDF do the placement maths on a scratch page, then keep the XObject
+    tmp = out_doc.new_page(width=w, height=h)
+    tmp.show_pdf_page(rect, h_doc, 0)
+    xobj_xref = [x[0] for x in tmp.get_xobjects() if x[2] == 0][0]
+    out_doc.delete_page(tmp.number)
+
+    return SharedHeader(xobj_xref, _new_stream(out_doc, f"q /{HEADER_NAME} Do Q"), {})
+
+def _add_header_resource(page, shared):
+    """Names the letterhead XObject in the page's resources, following indirect dictionaries."""
+    doc = page.parent
+    xref, path = page.xref, ""
+    for name in ("Resources", "XObject"):
+        path = f"{path}/{name}" if path else name
+        kind, value = doc.xref_get_key(xref, path)
+        if kind == "xref": xref, path = int(value.split()[0]), ""
+    doc.xref_set_key(xref, f"{path}/{HEADER_NAME}" if path else HEADER_NAME, f"{shared.xobj_xref} 0 R")
+
+def stamp_header(page, shared):
+    """Draws the shared letterhead on a freshly created page (before any other content)."""
+    _add_header_resource(page, shared)
+    page.parent.xref_set_key(page.xref, "Contents", f"[{shared.contents_xref} 0 R]")
+
+def _new_stream(doc, data, obj="<<>>"):
+    xref = doc.get_new_xref()
+    doc.update_object(xref, obj)
+    doc.update_stream(xref, data.encode())
+    return xref
+
+def placeholder_header(out_doc):
+    """An empty stand-in letterhead for pages stamped in a worker (see PARALLEL STAMPING)."""
+    xobj_xref = _new_stream(out_doc, "", "<</Type/XObject/Subtype/Form/BBox[0 0 1 1]>>")
+    return SharedHeader(xobj_xref, _new_stream(out_doc, f"q /{HEADER_NAME} Do Q"), {})
+
+def can_overlay(page):
+    """Whether a content page can be stamped in place: unrotated, no crop, origin at 0,0."""
+    return page.rotation == 0 and page.cropbox == page.mediabox and page.mediabox.x0 == 0 and page.mediabox.y0 == 0
+
+def overlay_header(page, shared, src, dst, w, h):
+    """Turns a copied content page into a stamped one, keeping its own content streams.
+
+    The page becomes w x h with the letterhead underneath. Its original
+    streams are wrapped in a clip and a transform that put `src` (page
+    points) where show_pdf_page would: scaled to fit `dst` and centred.
+    Pages with the same geometry share the wrapper streams.
+    """
+    doc = page.parent
+    src_h = page.rect.height
+    key = (tuple(src), src_h, tuple(dst))
+    wrap = shared.wraps.get(key)
+    if wrap is None:
+        f = min(dst.width / src.width, dst.height / src.height)
+        cw, ch = src.width * f, src.height * f
+        x0, y0 = dst.x0 + (dst.width - cw) / 2, dst.y0 + (dst.height - ch) / 2
+        prefix = (f"q {x0:.4f} {h - y0 - ch:.4f} {cw:.4f} {ch:.4f} re W n "  # no exponents in PDF numbers
+                  f"{f:.6f} 0 0 {f:.6f} {x0 - src.x0 * f:.4f} {h - y0 - (src_h - src.y0) * f:.4f} cm\n")
+        wrap = shared.wraps[key] = (_new_stream(doc, prefix), _new_stream(doc, "\nQ"))
+
+    contents = [shared.contents_xref, wrap[0]] + page.get_contents() + [wrap[1]]
+    page.set_mediabox(fitz.Rect(0, 0, w, h))
+    _add_header_resource(page, shared)
+    doc.xref_set_key(page.xref, "Contents", "[" + " ".join(f"{x} 0 R" for x in contents) + "]")
+
+# --- PROGRESS ---
+# Long operations take an optional `progress(stage, done, total)` callable.
+# It is called on the worker's thread (DOCX: a pool callback thread), so it
+# must not block; frontends throttle their own redraws.
+
+STAGE_STAMP = "stamp"  # pages stamped so far / content pages
+STAGE_SAVE = "save"    # 1 / 1 once the output PDF is written
+STAGE_DOCX = "docx"    # pages converted so far / PDF pages
+
+def _report(progress, stage, done, total):
+    if progress is not None:
+        progress(stage, done, total)
+
+# --- MERGE ---
+
+MODE_FIRST = "Apply to First Page Only"
+MODE_ALL = "Apply to All Pages"
+LAYOUT_FIT = "Shrink Page to Fit"
+LAYOUT_FLOW = "Flow Overflow to Next Page"
+STANDARD_GAP = 130  # "Industry Standard Gap" (1.8 inches)
+MIN_BAND = 36  # flow layout: the least room (pt) a header may leave for content
+
+@dataclass(frozen=True)
+class MergeConfig:
+    """Layout settings shared by merge and preview."""
+    mode: str = MODE_FIRST
+    y_offset: float = 0
+    header_scale: float = 100  # percent
+    use_standard: bool = False
+    gap: float = 10  # space left under the letterhead's lowest content
+    layout: str = LAYOUT_FIT
+    stamp: bool = True  # overlay the header onto copied pages instead of re-imposing them
+
+def content_start(bottom, cfg):
+    """Top of the content area: below the letterhead, or at the standard gap."""
+    if cfg.use_standard:
+        return STANDARD_GAP + cfg.y_offset
+    return bottom + cfg.gap + cfg.y_offset
+
+def _layout(h_doc, cfg, bottom):
+    h_page = h_doc[0]
+    w, h = h_page.rect.width, h_page.rect.height
+    if bottom is None and not cfg.use_standard:
+        with timed("header_bottom"): bottom = find_content_bottom(h_page)
+    return w, h, content_start(bottom, cfg), h * (cfg.header_scale / 100.0)
+
+# --- PAGE PLANS ---
+# A merge is planned for the whole document first, then executed. A plan
+# is a list of output pages, each (kind, [(content pno, clip, target rect)]):
+# COPY keeps the content page as it is, HEADER is a new page with the
+# letterhead, PLAIN a new page without it (a continuation page when only
+# the first page is stamped). OVERLAY copies the content page and draws
+# the letterhead into it (see overlay_header); its clip is the source
+# rect. It keeps the page's own content streams, which is smaller and
+# faster to write than wrapping each page in a Form XObject, and DOCX
+# conversion sees the original text instead of a nested form.
+
+COPY, HEADER, PLAIN, OVERLAY = "copy", "header", "plain", "overlay"
+
+@dataclass(frozen=True)
+class PageExtent:
+    """Vertical layout of a content page, in its own points."""
+    top: float
+    bottom: float
+    keep: tuple  # sorted, merged (y0, y1) spans of text lines and images a cut must not slice
+
+def page_extent(page):
+    """Content top/bottom and the spans a band cut must avoid; None for a blank page."""
+    width, height = page.rect.width, page.rect.height
+    tp = page.get_textpage(flags=BOTTOM_FLAGS)
+    top, bottom, spans = height, 0, []
+    for x0, y0, x1, y1, _, _, kind in tp.extractBLOCKS():
+        if y0 >= height or y1 <= 0 or x0 >= width or x1 <= 0: continue
+        if x1 - x0 >= width * BACKGROUND_COVER and y1 - y0 >= height * BACKGROUND_COVER: continue
+        top, bottom = min(top, max(y0, 0)), max(bottom, min(y1, height))
+        if kind == 1: spans.append((y0, y1))
+    if bottom <= top: return None
+    spans += [(w[1], w[3]) for w in tp.extractWORDS()]
+    spans.sort()
+    keep = []
+    for y0, y1 in spans:
+        if keep and y0 < keep[-1][1]: keep[-1][1] = max(keep[-1][1], y1)
+        else: keep.append([y0, y1])
+    return PageExtent(top, bottom, tuple(map(tuple, keep)))
+
+def _cut(extent, y, limit):
+    """Where to end a band that starts at y and may reach limit: above the line that limit would slice."""
+    for y0, y1 in extent.keep:
+        if y0 >= limit: break
+        if y0 < limit < y1:
+            return y0 if y0 > y else limit  # a single line taller than the band is cut anyway
+    return limit
+
+def flow_bands(extent, src_w, src_h, w, h, start_y, apply_all):
+    """Yields (kind, clip, target) bands for one content page laid out at full width.
+
+    On letterhead pages the content's top margin is replaced by start_y.
+    The bottom margin is the smaller of the page's two, so a short page
+    does not shrink the slot. Overflow continues on the next output page,
+    cut between text lines where possible.
+    """
+    s = w / src_w
+    slot_bottom = h - min(extent.top, src_h - extent.bottom) * s
+    kind, top, y = HEADER, start_y, extent.top
+    while True:
+        if slot_bottom - top < MIN_BAND:
+            raise ValueError("Header leaves no room for content; lower it or shrink it.")
+        limit = y + (slot_bottom - top) / s
+        cut = extent.bottom if limit >= extent.bottom else _cut(extent, y, limit)
+        yield kind, fitz.Rect(0, y, src_w, cut), fitz.Rect(0, top, w, top + (cut - y) * s)
+        if cut >= extent.bottom: return
+        y = cut
+        kind, top = (HEADER, start_y) if apply_all else (PLAIN, extent.top * s)
+
+def plan_fit(d_doc, w, h, start_y, apply_all, stamp=True):
+    """Each stamped content page is shrunk into the area below the header."""
+    if h - start_y < MIN_BAND:
+        raise ValueError("Header leaves no room for content; lower it or shrink it.")
+    plan = []
+    for i in range(len(d_doc)):
+        if not (i == 0 or apply_all):
+            plan.append((COPY, [(i, None, None)]))
+            continue
+        page, rect = d_doc[i], fitz.Rect(0, start_y, w, h)
+        if stamp and can_overlay(page):
+            plan.append((OVERLAY, [(i, page.rect, rect)]))
+        else:
+            plan.append((HEADER, [(i, None, rect)]))
+    return plan
+
+def plan_flow(d_doc, w, h, start_y, apply_all, stamp=True):
+    """Each stamped content page keeps its scale; what does not fit flows onto continuation pages."""
+    plan = []
+    for i in range(len(d_doc)):
+        if not (i == 0 or apply_all):
+            plan.append((COPY, [(i, None, None)]))
+            continue
+        page = d_doc[i]
+        extent = page_extent(page)
+        if extent is None:
+            plan.append((HEADER, []))  # blank content page: letterhead only
+            continue
+        bands = list(flow_bands(extent, page.rect.width, page.rect.height, w, h, start_y, apply_all))
+        if stamp and len(bands) == 1 and can_overlay(page):
+            bands = [(OVERLAY,) + bands[0][1:]]
+        for kind, clip, rect in bands:
+            plan.append((kind, [(i, clip, rect)]))
+    return plan
+
+def plan_pages(d_doc, cfg, w, h, start_y):
+    with timed("layout", pages=len(d_doc)):
+        plan = plan_flow if cfg.layout == LAYOUT_FLOW else plan_fit
+        return plan(d_doc, w, h, start_y, cfg.mode == MODE_ALL, cfg.stamp)
+
+def _copy_run(plan, start):
+    """End of the run of COPY/OVERLAY entries from `start` that copy consecutive pages."""
+    end = start + 1
+    while (end < len(plan) and plan[end][0] in (COPY, OVERLAY)
+           and (plan[end][0] == COPY) == (plan[start][0] == COPY)
+           and plan[end][1][0][0] == plan[end - 1][1][0][0] + 1):
+        end += 1
+    return end
+
+def _render_plan(out_doc, header, d_doc, plan, w, h, progress=None):
+    i = 0
+    while i < len(plan):
+        kind, parts = plan[i]
+        if kind in (COPY, OVERLAY):
+            # One insert_pdf per run of pages; overlaid pages drop their links and
+            # annotations, which would sit in the wrong place after the transform.
+            end = _copy_run(plan, i)
+            first = out_doc.page_count
+            out_doc.insert_pdf(d_doc, from_page=parts[0][0], to_page=plan[end - 1][1][0][0],
+                               links=kind == COPY, annots=kind == COPY)
+            if kind == OVERLAY:
+                for n, (_, entry) in enumerate(plan[i:end]):
+                    _, src, dst = entry[0]
+                    overlay_header(out_doc[first + n], header, src, dst, w, h)
+            i = end
+        else:
+            p = out_doc.new_page(width=w, height=h)
+            if kind == HEADER: stamp_header(p, header)
+            for pno, clip, rect in parts:
+                p.show_pdf_page(rect, d_doc, pno, clip=clip)
+            i += 1
+        if plan[i - 1][1]: _report(progress, STAGE_STAMP, plan[i - 1][1][-1][0] + 1, len(d_doc))
+
+def merge_docs(h_doc, d_doc, cfg=MergeConfig(), bottom=None, progress=None, workers=None):
+    """Stamps page 1 of h_doc onto d_doc and returns the new output document.
+
+    `bottom` lets callers pass a cached content bottom of the letterhead.
+    `workers` as for stamp_workers.
+    """
+    w, h, start_y, scaled_h = _layout(h_doc, cfg, bottom)
+    plan = plan_pages(d_doc, cfg, w, h, start_y)
+    workers = stamp_workers(len(plan), workers)
+    out_doc = fitz.open()
+    with timed("stamp", pages=len(plan), workers=workers):
+        header = build_shared_header(out_doc, h_doc, w, h, fitz.Rect(0, 0, w, scaled_h))
+        chunk_pages = len(plan) if workers == 1 else -(-len(plan) // (2 * workers))
+        for chunk, part in stamped_chunks(d_doc, plan, w, h, chunk_pages, workers):
+            _add_chunk(out_doc, header, d_doc, chunk, part, w, h, progress)
+    return out_doc
+
+STREAM_PAGES = 300  # longer content is merged in chunks through a temp file
+STREAM_CHUNK_PAGES = 50
+
+def merge_to_file(h_doc, d_doc, path, cfg=MergeConfig(), bottom=None, chunk_pages=STREAM_CHUNK_PAGES,
+                  progress=None, workers=None):
+    """Streaming merge: writes `path` chunk by chunk with incremental saves.
+
+    After each chunk the output is saved incrementally and re-opened, so
+    MuPDF drops everything it has already written. Peak memory follows the
+    chunk size, not the page count. The shared header objects keep their
+    xrefs across re-opens, so every chunk still points at the same copy.
+    With several workers the chunks are stamped in parallel and joined
+    here in order.
+    """
+    w, h, start_y, scaled_h = _layout(h_doc, cfg, bottom)
+    plan = plan_pages(d_doc, cfg, w, h, start_y)
+    workers = stamp_workers(len(plan), workers)
+    out_doc = fitz.open()
+    header = build_shared_header(out_doc, h_doc, w, h, fitz.Rect(0, 0, w, scaled_h))
+    chunks = stamped_chunks(d_doc, plan, w, h, chunk_pages, workers)
+    try:
+        for n, (chunk, part) in enumerate(chunks):
+            with timed("stamp", pages=len(chunk), workers=workers):
+                _add_chunk(out_doc, header, d_doc, chunk, part, w, h, progress)
+            with timed("save", pages=len(chunk)) as rec:
+                if n == 0: out_doc.save(path)
+                else: out_doc.saveIncr()
+                out_doc.close()
+                rec["nbytes"] = os.path.getsize(path)
+            out_doc = fitz.open(path)
+    finally:
+        chunks.close()
+        out_doc.close()
+    _report(progress, STAGE_SAVE, 1, 1)
+
+def merge_pdf(hinfo, d_doc, cfg=MergeConfig(), progress=None, workers=None):
+    """merge_docs with an analysed letterhead; returns the saved PDF bytes.
+
+    Content longer than STREAM_PAGES goes through merge_to_file so the
+    page tree is never held in memory all at once.
+    """
+    if len(d_doc) > STREAM_PAGES:
+        t = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+        t.close()
+        try:
+            merge_to_file(hinfo.doc, d_doc, t.name, cfg, hinfo.bottom, progress=progress, workers=workers)
+            with open(t.name, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(t.name)
+
+    out_doc = merge_docs(hinfo.doc, d_doc, cfg, hinfo.bottom, progress, workers)
+    try:
+        with timed("save") as rec:
+            pdf_bytes = out_doc.tobytes()
+            rec["nbytes"] = len(pdf_bytes)
+    finally:
+        out_doc.close()
+    _report(progress, STAGE_SAVE, 1, 1)
+    return pdf_bytes
+
+# --- PARALLEL STAMPING ---
+# Long plans can be cut into chunks that worker processes stamp into
+# partial PDFs; the parent appends them in order with insert_pdf. Workers
+# draw a tiny placeholder instead of the letterhead and the parent points
+# the joined pages at its own shared header, so the output still carries
+# one copy of it.
+
+STAMP_WORKERS = os.cpu_count() or 1
+PARALLEL_PAGES = 1000  # fewer output pages are stamped in-process (see benchmarks/bench_parallel_stamp.py)
+
+_stamp_pool = None
+_stamp_pool_lock = threading.Lock()
+
+def stamp_workers(plan_pages, workers=None):
+    """Processes to stamp with: `workers` if given, else all CPUs for plans of PARALLEL_PAGES or more."""
+    if workers is None:
+        workers = STAMP_WORKERS if plan_pages >= PARALLEL_PAGES else 1
+    return max(1, workers)
+
+def get_stamp_pool():
+    """Process pool for stamping chunks, separate from the DOCX pool so merges never queue behind conversions."""
+    global _stamp_pool
+    with _stamp_pool_lock:
+        if _stamp_pool is None:
+            _stamp_pool = ProcessPoolExecutor(max_workers=STAMP_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _stamp_pool
+
+def _stamp_chunk(source, plan, w, h):
+    """Worker: stamps a slice of a plan with a placeholder letterhead; returns the partial PDF bytes."""
+    with timed("stamp_chunk", pages=len(plan)) as rec:
+        with fitz.open(source) as d_doc, fitz.open() as out_doc:
+            _render_plan(out_doc, placeholder_header(out_doc), d_doc, plan, w, h)
+            data = out_doc.tobytes()
+        rec["nbytes"] = len(data)
+    return data
+
+def stamped_chunks(d_doc, plan, w, h, chunk_pages, workers=1):
+    """Yields (slice of plan, partial PDF bytes from a worker or None to stamp in-process), in order.
+
+    Workers read the content from its file, or from one temp copy if it was
+    opened from memory or changed since. At most two chunks per worker are
+    in flight.
+    """
+    chunks = [plan[i:i + chunk_pages] for i in range(0, len(plan), chunk_pages)]
+    if workers == 1 or len(chunks) == 1:
+        for chunk in chunks: yield chunk, None
+        return
+
+    source = d_doc.name if d_doc.name and os.path.isfile(d_doc.name) and not d_doc.is_dirty else None
+    if source is None:
+        t = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+        with timed("spill") as rec:
+            data = d_doc.stream if d_doc.stream is not None and not d_doc.is_dirty else d_doc.tobytes()
+            t.write(data); t.close()
+            rec["nbytes"] = len(data)
+    pool, pending, submitted = get_stamp_pool(), deque(), 0
+    try:
+        while pending or submitted < len(chunks):
+            while submitted < len(chunks) and len(pending) < 2 * workers:
+                pending.append((chunks[submitted], pool.submit(_stamp_chunk, source or t.name, chunks[submitted], w, h)))
+                submitted += 1
+            chunk, job = pending.popleft()
+            yield chunk, job.result()
+    finally:
+        for _, job in pending: job.cancel()
+        if source is None: os.remove(t.name)
+
+def _add_chunk(out_doc, header, d_doc, chunk, part, w, h, progress=None):
+    """Appends one chunk of a plan to out_doc: stamps it here, or joins a worker's partial PDF."""
+    if part is None:
+        _render_plan(out_doc, header, d_doc, chunk, w, h, progress)
+        return
+    first = out_doc.page_count
+    with fitz.open("pdf", part) as part_doc:
+        out_doc.insert_pdf(part_doc)
+    for n, (kind, _) in enumerate(chunk):
+        if kind in (HEADER, OVERLAY): _add_header_resource(out_doc[first + n], header)
+    done = [parts for _, parts in chunk if parts]
+    if done: _report(progress, STAGE_STAMP, done[-1][-1][0] + 1, len(d_doc))
+
+# --- LETTERHEAD CACHE ---
+
+PREVIEW_DPI = 100
+
+@dataclass
+class HeaderInfo:
+    """Everything derived from a letterhead that does not depend on the layout settings."""
+    key: str
+    doc: fitz.Document
+    width: float
+    height: float
+    bottom: float
+    preview_pix: fitz.Pixmap
+    nbytes: int
+
+def analyze_header(data, key=None, filetype="pdf", bottom_mode=BOTTOM_AUTO):
+    """Parses a letterhead once and precomputes its size, content bottom and preview raster."""
+    key = key or hashlib.sha256(data).hexdigest()
+    doc = open_document(bytes(data), filetype)
+    page = doc[0]
+    with timed("header_raster") as rec:
+        pix = page.get_pixmap(dpi=PREVIEW_DPI)
+        rec["nbytes"] = len(pix.samples_mv)
+    with timed("header_bottom"):
+        bottom = find_content_bottom(page, bottom_mode, pix)
+    nbytes = 2 * len(data) + len(pix.samples_mv)  # source bytes + parsed objects (rough) + raster
+    return HeaderInfo(key, doc, page.rect.width, page.rect.height, bottom, pix, nbytes)
+
+class LRUCache:
+    """Thread-safe LRU bounded by entry count and by approximate memory.
+
+    Values must expose ``nbytes``. Evicted values are simply dropped, so a
+    session still holding one keeps a working object until it is done;
+    subclasses whose values hold resources override _dropped.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Stores value unless another thread got there first; returns the cached one."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._entries[key] = value
+            self._bytes += value.nbytes
+            self._evict()
+            return value
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory())
+        return value
+
+    def _evict(self):
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.nbytes
+            self._dropped(old)
+
+    def _dropped(self, value):
+        """Called with each value evicted or cleared, under the cache lock."""
+
+    def clear(self):
+        with self._lock:
+            for value in self._entries.values(): self._dropped(value)
+            self._entries.clear()
+            self._bytes = 0
+
+_image_pdfs = LRUCache(max_entries=32, max_bytes=128 * 1024 * 1024)  # image_to_pdf results
+
+class HeaderCache(LRUCache):
+    """Analysed letterheads keyed by the SHA-256 of their bytes (and a non-default bottom mode)."""
+
+    def analyze(self, data, filetype="pdf", bottom_mode=BOTTOM_AUTO):
+        key = hashlib.sha256(data).hexdigest()
+        if bottom_mode != BOTTOM_AUTO: key += f":{bottom_mode}"
+        return self.get_or_create(key, lambda: analyze_header(data, key, filetype, bottom_mode))
+
+# --- INCREMENTAL PREVIEW ---
+
+PREVIEW_DRAFT_DPI = 24  # progressive preview: the quick first image; also the lowest adaptive dpi
+PREVIEW_FORMATS = ("JPEG", "WEBP", "PNG")
+PREVIEW_FORMAT = "JPEG"
+PREVIEW_QUALITY = 80  # JPEG/WebP; PNG is lossless
+DRAFT_QUALITY = 50
+
+def preview_dpi(display_px, page_width, pixel_ratio=1):
+    """The dpi at which a page `page_width` pt wide fills `display_px` CSS pixels.
+
+    Capped at PREVIEW_DPI, the letterhead raster's resolution: above it the
+    preview would only be upscaled.
+    """
+    return max(PREVIEW_DRAFT_DPI, min(PREVIEW_DPI, round(display_px * pixel_ratio * 72 / page_width)))
+
+@dataclass
+class ContentRaster:
+    """A content page rendered once, ready to be re-composited."""
+    image: object  # PIL.Image, RGB on white
+    width: float
+    height: float
+    nbytes: int
+    extent: PageExtent = None  # for the flow layout; None if the page is blank
+
+def _pix_to_image(pix):
+    from PIL import Image
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+def render_content_raster(d_doc, pno=0, dpi=PREVIEW_DPI):
+    page = d_doc[pno]
+    with timed("content_raster") as rec:
+        pix = page.get_pixmap(dpi=dpi, alpha=False)
+        rec["nbytes"] = len(pix.samples_mv)
+    return ContentRaster(_pix_to_image(pix), page.rect.width, page.rect.height, len(pix.samples_mv),
+                         page_extent(page))
+
+def _open(data, filetype, opener):
+    """opener() if given (a context manager yielding the document, like DocumentCache.use), else a fresh document."""
+    return opener() if opener else open_document(data, filetype)
+
+class ContentRasterCache(LRUCache):
+    """First-page rasters of content files keyed by the SHA-256 of their bytes and the dpi."""
+
+    def render(self, data, filetype="pdf", dpi=PREVIEW_DPI, key=None, opener=None):
+        key = key or hashlib.sha256(data).hexdigest()
+        def make():
+            with _open(data, filetype, opener) as d_doc:
+                return render_content_raster(d_doc, 0, dpi)
+        return self.get_or_create(f"{key}:{dpi}", make)
+
+    def previews(self, hinfo, data, cfg=MergeConfig(), filetype="pdf", dpi=PREVIEW_DPI, fmt=PREVIEW_FORMAT,
+                 quality=PREVIEW_QUALITY, opener=None):
+        """Yields the preview progressively: a draft at PREVIEW_DRAFT_DPI, then the sharp image.
+
+        The draft is skipped when the content is already rendered at `dpi`,
+        since the sharp image is then only a re-composite away.
+        """
+        key = hashlib.sha256(data).hexdigest()
+        if dpi > PREVIEW_DRAFT_DPI and self.get(f"{key}:{dpi}") is None:
+            draft = self.render(data, filetype, PREVIEW_DRAFT_DPI, key, opener)
+            yield composite_preview(hinfo, draft, cfg, PREVIEW_DRAFT_DPI, fmt, DRAFT_QUALITY)
+        yield composite_preview(hinfo, self.render(data, filetype, dpi, key, opener), cfg, dpi, fmt, quality)
+
+def composite_preview(hinfo, content, cfg=MergeConfig(), dpi=PREVIEW_DPI, fmt=PREVIEW_FORMAT, quality=PREVIEW_QUALITY):
+    """Lays the cached header and content rasters out the way process_merge does.
+
+    Mirrors show_pdf_page's placement: each source is scaled uniformly to
+    fit its target rect and centred in it. With LAYOUT_FLOW the content is
+    the first band of the flow layout instead. The content is blended with
+    "darker" so its white paper lets the letterhead show through, like the
+    unpainted background of a PDF page. Returns the image encoded as
+    `fmt` (one of PREVIEW_FORMATS) at `quality`.
+    """
+    from PIL import Image, ImageChops
+    k = dpi / 72
+    w, h = hinfo.width, hinfo.height
+    start_y = content_start(hinfo.bottom, cfg)
+    canvas = Image.new("RGB", (round(w * k), round(h * k)), "white")
+
+    s = cfg.header_scale / 100.0
+    hdr = _pix_to_image(hinfo.preview_pix)
+    size = (max(1, round(w * s * k)), max(1, round(h * s * k)))
+    if hdr.size != size:
+        hdr = hdr.resize(size, Image.BOX)
+    canvas.paste(hdr, (round((w - w * s) / 2 * k), 0))
+
+    src = dst = None  # content points -> page points
+    if cfg.layout == LAYOUT_FLOW:
+        if content.extent is not None:
+            _, src, dst = next(flow_bands(content.extent, content.width, content.height, w, h, start_y, False))
+    else:
+        box_h = h - start_y
+        if box_h < MIN_BAND:
+            raise ValueError("Header leaves no room for content; lower it or shrink it.")
+        f = min(w / content.width, box_h / content.height)
+        cw, ch = content.width * f, content.height * f
+        src = fitz.Rect(0, 0, content.width, content.height)
+        dst = fitz.Rect((w - cw) / 2, start_y + (box_h - ch) / 2, (w + cw) / 2, start_y + (box_h + ch) / 2)
+
+    if dst is not None:
+        ck = content.image.width / content.width
+        body = content.image
+        if src.y0 > 0 or src.y1 < content.height:
+            body = body.crop((0, round(src.y0 * ck), body.width, round(src.y1 * ck)))
+        body = body.resize((max(1, round(dst.width * k)), max(1, round(dst.height * k))), Image.BOX)
+        x0, y0 = round(dst.x0 * k), round(dst.y0 * k)
+
+        # Clip to the canvas (start_y can be negative)
+        left, top = max(0, -x0), max(0, -y0)
+        right, bottom = min(body.width, canvas.width - x0), min(body.height, canvas.height - y0)
+        if right > left and bottom > top:
+            body = body.crop((left, top, right, bottom))
+            x0, y0 = x0 + left, y0 + top
+            region = canvas.crop((x0, y0, x0 + body.width, y0 + body.height))
+            canvas.paste(ImageChops.darker(region, body), (x0, y0))
+
+    buf = io.BytesIO()
+    with timed("preview_encode", fmt=fmt, dpi=dpi) as rec:
+        canvas.save(buf, fmt, **({} if fmt == "PNG" else {"quality": quality}))
+        rec["nbytes"] = buf.tell()
+    return buf.getvalue()
+
+# --- PAGE THUMBNAILS ---
+# The page gallery shows merged pages a few at a time. A thumbnail is the
+# exact output page: its plan entry is rendered into a scratch document
+# with the shared header, then rasterized at THUMB_DPI. Only the pages
+# asked for are rendered. The plan for the whole document is kept per
+# (letterhead, content, settings), so paging through the gallery only
+# opens the content again to render the new pages.
+
+THUMB_DPI = 24  # A4 is about 200 x 280 pixels
+THUMB_JPEG_QUALITY = 75
+
+@dataclass
+class MergePlan:
+    plan: list
+    width: float
+    height: float
+    header_height: float  # letterhead height after header_scale
+    nbytes: int
+
+@dataclass
+class Thumbnail:
+    data: bytes  # JPEG
+    nbytes: int
+
+def merge_plan(hinfo, d_doc, cfg=MergeConfig()):
+    """The page plan merge_pdf would follow, without merging anything."""
+    w, h, start_y, scaled_h = _layout(hinfo.doc, cfg, hinfo.bottom)
+    plan = plan_pages(d_doc, cfg, w, h, start_y)
+    return MergePlan(plan, w, h, scaled_h, 256 * len(plan))
+
+def render_thumbnails(hinfo, d_doc, mplan, pnos, dpi=THUMB_DPI):
+    """Thumbnails of output pages `pnos` of mplan."""
+    w, h = mplan.width, mplan.height
+    out_doc = fitz.open()
+    try:
+        header = build_shared_header(out_doc, hinfo.doc, w, h, fitz.Rect(0, 0, w, mplan.header_height))
+        for pno in pnos:
+            _render_plan(out_doc, header, d_doc, [mplan.plan[pno]], w, h)
+        thumbs = []
+        for page in out_doc:
+            with timed("thumbnail") as rec:
+                data = page.get_pixmap(dpi=dpi, alpha=False).tobytes("jpeg", jpg_quality=THUMB_JPEG_QUALITY)
+                rec["nbytes"] = len(data)
+            thumbs.append(Thumbnail(data, len(data)))
+        return thumbs
+    finally:
+        out_doc.close()
+
+class ThumbnailCache(LRUCache):
+    """Merged-page thumbnails keyed by (header hash, content hash, settings, dpi, output page)."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        super().__init__(max_entries, max_bytes)
+        self._plans = LRUCache(max_entries=8)
+
+    def _plan(self, hinfo, data, filetype, cfg, opener):
+        key = (hinfo.key, hashlib.sha256(data).hexdigest(), cfg)
+        mplan = self._plans.get(key)
+        if mplan is None:
+            with _open(data, filetype, opener) as d_doc:
+                mplan = self._plans.put(key, merge_plan(hinfo, d_doc, cfg))
+        return key, mplan
+
+    def page_count(self, hinfo, data, cfg=MergeConfig(), filetype="pdf", opener=None):
+        """Number of merged pages. Plans the layout (flow reads every page's text) but renders nothing."""
+        return len(self._plan(hinfo, data, filetype, cfg, opener)[1].plan)
+
+    def thumbnails(self, hinfo, data, pnos, cfg=MergeConfig(), filetype="pdf", dpi=THUMB_DPI, opener=None):
+        """JPEG bytes of merged pages `pnos`, rendering only the ones not cached yet."""
+        plan_key, mplan = self._plan(hinfo, data, filetype, cfg, opener)
+        keys = [plan_key + (dpi, pno) for pno in pnos]
+        found = {key: self.get(key) for key in keys}
+        missing = [key for key in keys if found[key] is None]
+        if missing:
+            with _open(data, filetype, opener) as d_doc:
+                rendered = render_thumbnails(hinfo, d_doc, mplan, [key[-1] for key in missing], dpi)
+            for key, thumb in zip(missing, rendered):
+                found[key] = self.put(key, thumb)
+        return [found[key].data for key in keys]
+
+# --- UPLOADED DOCUMENT CACHE ---
+# Streamlit reruns the whole script on every interaction, and each preview
+# or merge used to parse the upload again. A session's DocumentCache keeps
+# the parsed documents open between reruns instead.
+
+class CachedDocument:
+    """An open document shared by one session's reruns and its queued merge.
+
+    A fitz.Document is not thread-safe, so one caller uses it at a time
+    (acquire/release). Once evicted it is closed by whoever lets go last.
+    """
+
+    def __init__(self, doc, nbytes):
+        self.doc, self.nbytes = doc, nbytes
+        self._busy = self._evicted = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """True if the caller now has the document until release(); False if it is in use or closed."""
+        with self._lock:
+            if self._busy or self._evicted: return False
+            self._busy = True
+            return True
+
+    def release(self):
+        with self._lock:
+            self._busy = False
+            if self._evicted: self.doc.close()
+
+    def evict(self):
+        with self._lock:
+            self._evicted = True
+            if not self._busy: self.doc.close()
+
+class DocumentCache(LRUCache):
+    """Parsed uploads of one session, keyed by (upload file_id, content SHA-256)."""
+
+    def __init__(self, max_entries=4, max_bytes=512 * 1024 * 1024):
+        super().__init__(max_entries, max_bytes)
+
+    def _dropped(self, value):
+        value.evict()
+
+    @contextlib.contextmanager
+    def use(self, uploaded_file, filetype="pdf"):
+        """The upload's parsed document for the duration of the with block. Do not close it.
+
+        If the cached document is busy (a merge of it still running on the
+        queue), a private copy is opened and closed instead of waiting.
+        """
+        data = uploaded_file.getbuffer()
+        key = (uploaded_file.file_id, hashlib.sha256(data).hexdigest())
+        entry = self.get(key)
+        if entry is None:
+            fresh = CachedDocument(open_upload(uploaded_file, filetype), 2 * data.nbytes)
+            entry = self.put(key, fresh)
+            if entry is not fresh: fresh.evict()  # another thread opened it first
+        if not entry.acquire():
+            with open_upload(uploaded_file, filetype) as d_doc:
+                yield d_doc
+            return
+        try:
+            yield entry.doc
+        finally:
+            entry.release()
+
+    def page_count(self, uploaded_file, filetype="pdf"):
+        """Like page_count, from the cached document."""
+        if filetype in IMAGE_TYPES: return 1
+        try:
+            with self.use(uploaded_file, filetype) as d_doc: return d_doc.page_count
+        except Exception:
+            return 1
+
+# --- BACKGROUND DOCX CONVERSION ---
+
+DOCX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DOCX_CHUNK_PAGES = 4  # smallest page range worth shipping to its own worker
+DOCX_PROGRESS_PAGES = 16  # with a progress callback, report at least this often
+
+_docx_pool = None
+_docx_pool_lock = threading.Lock()
+
+def pdf_to_docx(pdf_bytes):
+    """Converts an in-memory PDF with pdf2docx and returns the DOCX bytes."""
+    from pdf2docx import Converter  # heavy, only needed in the worker
+    docx_buf = io.BytesIO()
+    with timed("docx", len(pdf_bytes)) as rec:
+        cv = Converter(stream=pdf_bytes)
+        try:
+            cv.convert(docx_buf)
+        finally:
+            cv.close()
+        rec["docx_bytes"] = docx_buf.tell()
+    return docx_buf.getvalue()
+
+def split_pages(page_count, parts):
+    """Splits range(page_count) into at most `parts` contiguous, near-equal page lists."""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    chunks, start = [], 0
+    for i in range(parts):
+        end = start + size + (i < extra)
+        chunks.append(list(range(start, end)))
+        start = end
+    return [c for c in chunks if c]
+
+def _parse_docx_chunk(pdf_bytes, pages):
+    """Worker: runs pdf2docx's layout parsing on some pages and returns the stored layouts."""
+    from pdf2docx import Converter
+    with timed("docx_parse", len(pdf_bytes), pages=len(pages)):
+        cv = Converter(stream=pdf_bytes)
+        try:
+            cv.parse(pages=pages, **cv.default_settings)
+            return [page.store() for page in cv.pages if page.finalized]
+        finally:
+            cv.close()
+
+def _stitch_docx(pdf_bytes, page_count, layouts):
+    """Worker: builds one DOCX from the layouts parsed by the chunk workers."""
+    from pdf2docx import Converter
+    docx_buf = io.BytesIO()
+    with timed("docx_stitch", pages=page_count) as rec:
+        cv = Converter(stream=pdf_bytes)
+        try:
+            for pages in layouts:
+                cv.restore({"page_cnt": page_count, "pages": pages})
+            cv.make_docx(docx_buf, **cv.default_settings)
+        finally:
+            cv.close()
+        rec["nbytes"] = docx_buf.tell()
+    return docx_buf.getvalue()
+
+def get_docx_pool():
+    """Process pool shared by every session; spawned so workers never fork the web server."""
+    global _docx_pool
+    with _docx_pool_lock:
+        if _docx_pool is None:
+            _docx_pool = ProcessPoolExecutor(max_workers=DOCX_WORKERS,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return _docx_pool
+
+def shutdown_docx_pool():
+    """Stops the shared DOCX pool if it was started (a later submit_docx starts a new one)."""
+    global _docx_pool
+    with _docx_pool_lock:
+        pool, _docx_pool = _docx_pool, None
+    if pool is not None: pool.shutdown(cancel_futures=True)
+
+def submit_docx(pdf_bytes, workers=None, pool=None, progress=None):
+    """Queues a DOCX conversion and returns its Future.
+
+    Documents long enough are split into page ranges that are parsed on
+    up to `workers` processes and stitched into one DOCX by a final task.
+    With `progress`, ranges are also capped at DOCX_PROGRESS_PAGES so that
+    STAGE_DOCX is reported as each range finishes.
+    Future.cancel() drops a job that has not started stitching yet; a
+    running job finishes in its worker and its result is never collected.
+    """
+    pool = pool or get_docx_pool()
+    workers = workers or DOCX_WORKERS
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = len(doc)
+    n_parts = workers if progress is None else max(workers, -(-page_count // DOCX_PROGRESS_PAGES))
+    chunks = split_pages(page_count, min(n_parts, page_count // DOCX_CHUNK_PAGES))
+    _report(progress, STAGE_DOCX, 0, page_count)
+    if len(chunks) <= 1:
+        job = pool.submit(pdf_to_docx, pdf_bytes)
+        def whole_done(j):
+            if not (j.cancelled() or j.exception()):
+                _report(progress, STAGE_DOCX, page_count, page_count)
+        job.add_done_callback(whole_done)
+        return job
+
+    job = Future()
+    parts = [pool.submit(_parse_docx_chunk, pdf_bytes, pages) for pages in chunks]
+    remaining = [len(parts)]
+    converted = [0]
+    lock = threading.Lock()
+
+    def finish(final):
+        if final.exception(): job.set_exception(final.exception())
+        else: job.set_result(final.result())
+
+    def part_done(part):
+        with lock:
+            remaining[0] -= 1
+            if not (part.cancelled() or part.exception()):
+                converted[0] += len(chunks[parts.index(part)])
+                _report(progress, STAGE_DOCX, converted[0], page_count)
+            if remaining[0]: return
+        if not job.set_running_or_notify_cancel(): return
+        failed = [p for p in parts if p.cancelled() or p.exception()]
+        if failed:
+            p = failed[0]
+            job.set_exception(RuntimeError("DOCX chunk cancelled") if p.cancelled() else p.exception())
+            return
+        pool.submit(_stitch_docx, pdf_bytes, page_count, [p.result() for p in parts]).add_done_callback(finish)
+
+    def cancel_parts(j):
+        if j.cancelled():
+            for p in parts: p.cancel()
+
+    job.add_done_callback(cancel_parts)
+    for p in parts:
+        p.add_done_callback(part_done)
+    return job
@@ -0,0 +1,149 @@
+"""Per-stage timings and byte counts for the merge pipeline.
+
+Every stage wrapped in ``timed()`` yields one record: the stage name, how
+long it took and how many bytes it handled. Records go to two places:
+
+* the ``letterhead.metrics`` logger as one JSON object per line. Set
+  LETTERHEAD_METRICS_LOG=path to append them to a file, or attach your own
+  handler. Nothing is logged without one: the logger does not propagate,
+  so a root logger configured by a library (pdf2docx calls basicConfig)
+  does not print the records to stderr.
+* in-process histograms. Set LETTERHEAD_METRICS_DIR=dir and each process
+  rewrites dir/letterhead_<pid>.prom in Prometheus text format, at most
+  every FLUSH_SECONDS. That directory can be served by node_exporter's
+  textfile collector. DOCX and stamp workers are separate processes, so
+  they write their own files; every series carries a ``pid`` label to keep
+  them apart. A process removes its file at exit, and files of processes
+  that are gone are swept on each write.
+
+Without either variable only the histograms in memory are updated.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB .. 1 GiB
+FLUSH_SECONDS = 10
+
+log = logging.getLogger("letterhead.metrics")
+log.propagate = False
+log.setLevel(logging.INFO)
+if os.environ.get("LETTERHEAD_METRICS_LOG"):
+    _handler = logging.FileHandler(os.environ["LETTERHEAD_METRICS_LOG"])
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with one series per stage."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}  # stage -> [bucket counts..., sum, count]
+
+    def observe(self, stage, value):
+        s = self.series.get(stage)
+        if s is None:
+            s = self.series[stage] = [0] * len(self.buckets) + [0, 0]
+        for i, le in enumerate(self.buckets):
+            if value <= le: s[i] += 1
+        s[-2] += value
+        s[-1] += 1
+
+    def render(self, name, help_text, labels=""):
+        """Text format lines; `labels` ('pid="12",') is prepended to every series' labels."""
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for stage, s in sorted(self.series.items()):
+            for le, n in zip(self.buckets, s):
+                lines.append(f'{name}_bucket{{{labels}stage="{stage}",le="{le}"}} {n}')
+            lines.append(f'{name}_bucket{{{labels}stage="{stage}",le="+Inf"}} {s[-1]}')
+            lines.append(f'{name}_sum{{{labels}stage="{stage}"}} {s[-2]}')
+            lines.append(f'{name}_count{{{labels}stage="{stage}"}} {s[-1]}')
+        return "\n".join(lines) + "\n"
+
+_lock = threading.Lock()
+_write_lock = threading.Lock()  # one writer of this process's .prom file at a time
+_seconds = Histogram(SECONDS_BUCKETS)
+_bytes = Histogram(BYTES_BUCKETS)
+_last_flush = [0.0]
+
+def record(stage, seconds, nbytes=0, **fields):
+    """Adds one stage measurement to the histograms and the JSON log."""
+    with _lock:
+        _seconds.observe(stage, seconds)
+        if nbytes: _bytes.observe(stage, nbytes)
+        due = time.monotonic() - _last_flush[0] >= FLUSH_SECONDS
+        if due: _last_flush[0] = time.monotonic()  # only this thread flushes
+    if log.handlers and log.isEnabledFor(logging.INFO):
+        log.info(json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "stage": stage,
+                             "seconds": round(seconds, 6), "bytes": nbytes, **fields}))
+    if due: write_prometheus()
+
+@contextmanager
+def timed(stage, nbytes=0, **fields):
+    """Times the block as `stage`; the yielded dict can update "nbytes" or add fields."""
+    rec = {"nbytes": nbytes, **fields}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        record(stage, time.perf_counter() - t0, **rec)
+
+def prometheus_text(pid_label=False):
+    """The current histograms in Prometheus text exposition format, optionally labelled with this pid."""
+    labels = f'pid="{os.getpid()}",' if pid_label else ""
+    with _lock:
+        return (_seconds.render("letterhead_stage_seconds", "Time spent in each merge pipeline stage.", labels)
+                + _bytes.render("letterhead_stage_bytes", "Bytes handled by each merge pipeline stage.", labels))
+
+def _prom_path(directory, pid):
+    return os.path.join(directory, f"letterhead_{pid}.prom")
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # exists, owned by someone else
+        pass
+    return True
+
+def _sweep(directory):
+    """Removes .prom files left by processes that are gone."""
+    for name in os.listdir(directory):
+        pid = name[len("letterhead_"):-len(".prom")]
+        if name.startswith("letterhead_") and name.endswith(".prom") and pid.isdigit() and not _alive(int(pid)):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+def write_prometheus(directory=None):
+    """Atomically rewrites this process's .prom file if a metrics directory is configured."""
+    directory = directory or os.environ.get("LETTERHEAD_METRICS_DIR")
+    if not directory: return
+    path = _prom_path(directory, os.getpid())
+    with _write_lock:
+        _last_flush[0] = time.monotonic()
+        try:
+            with open(path + ".tmp", "w") as f: f.write(prometheus_text(pid_label=True))
+            os.replace(path + ".tmp", path)
+            _sweep(directory)
+        except OSError as e:
+            log.warning("could not write %s: %s", path, e)
+
+@atexit.register
+def _remove_prometheus():
+    """Takes this process's series out of the textfile directory when it exits."""
+    directory = os.environ.get("LETTERHEAD_METRICS_DIR")
+    if not directory: return
+    with _write_lock:
+        for path in (_prom_path(directory, os.getpid()), _prom_path(directory, os.getpid()) + ".tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
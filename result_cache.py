@@ -0,0 +1,133 @@
+"""Persistent, content-addressed cache of merge results.
+
+A merged PDF is a pure function of the letterhead bytes, the content bytes
+and the MergeConfig, and the Word file is a pure function of the PDF. So
+results are stored under a hash of exactly those inputs (see result_key;
+Word files are keyed by the hash of their PDF) and a repeated GENERATE
+returns them without merging or converting again.
+
+Entries are plain files in one directory, written atomically, so several
+processes can share it. The directory is bounded by size: after each
+write the least recently used entries (file mtime, refreshed on every hit)
+are deleted until it fits. Entries not used for `ttl` seconds are deleted
+too.
+
+LETTERHEAD_CACHE_DIR overrides the location (default
+~/.cache/letterhead), LETTERHEAD_CACHE_MB the size bound.
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+from pipeline_metrics import timed
+
+CACHE_VERSION = 2  # bump when merge output changes, to ignore older entries
+MAX_BYTES = int(os.environ.get("LETTERHEAD_CACHE_MB", 1024)) * 1024 * 1024
+TTL = 7 * 24 * 3600
+
+def default_dir():
+    return os.environ.get("LETTERHEAD_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "letterhead")
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def result_key(header_hash, content_hash, cfg):
+    """Key of a merge: both inputs' hashes and every MergeConfig field."""
+    params = json.dumps([CACHE_VERSION, header_hash, content_hash, dataclasses.asdict(cfg)], sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()
+
+class ResultCache:
+    """Bytes on disk by (key, kind), bounded by total size (LRU) and idle time (TTL)."""
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, ttl=TTL):
+        self.directory = directory or default_dir()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()  # one eviction scan at a time per process
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key, kind):
+        return os.path.join(self.directory, f"{key}.{kind}")
+
+    def get(self, key, kind):
+        """The cached bytes, or None if missing or expired."""
+        path = self._path(key, kind)
+        with timed("result_cache", kind=kind) as rec:
+            try:
+                if time.time() - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+                    rec["hit"] = False
+                    return None
+                with open(path, "rb") as f: data = f.read()
+                os.utime(path)  # most recently used
+            except OSError:
+                rec["hit"] = False
+                return None
+            rec.update(hit=True, nbytes=len(data))
+            return data
+
+    def put(self, key, kind, data):
+        """Stores data atomically, then evicts down to the size bound. Disk errors are ignored."""
+        if len(data) > self.max_bytes: return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f: f.write(data)
+            os.replace(tmp, self._path(key, kind))
+        except OSError:
+            return
+        self.evict()
+
+    def put_file(self, key, kind, path):
+        """Like put, copying an existing file instead of holding its bytes in memory."""
+        try:
+            if os.path.getsize(path) > self.max_bytes: return
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as dst, open(path, "rb") as src: shutil.copyfileobj(src, dst)
+            os.replace(tmp, self._path(key, kind))
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes expired entries, then the least recently used ones until the total fits."""
+        with self._lock:
+            now, entries, total = time.time(), [], 0
+            for e in os.scandir(self.directory):
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                if now - st.st_mtime > self.ttl or (e.name.endswith(".tmp") and now - st.st_mtime > 3600):
+                    self._remove(e.path)
+                elif not e.name.endswith(".tmp"):
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes: break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def job(self, key, kind, submit):
+        """A Future for a cached result: already done on a hit, else submit() whose result is stored when it succeeds."""
+        data = self.get(key, kind)
+        if data is not None:
+            done = Future()
+            done.set_result(data)
+            return done
+        job = submit()
+        job.add_done_callback(lambda f: f.cancelled() or f.exception() or self.put(key, kind, f.result()))
+        return job
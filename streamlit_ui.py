@@ -0,0 +1,233 @@
+"""Streamlit glue shared by the letterhead apps (app.py, app.4.py, app_Extra.py).
+
+The apps differ in theme and settings widgets. Each builds a MergeConfig
+from its widgets and passes it here with the two uploads. File types come
+from the upload names (file_type), so the PDF-only apps and the PDF/image
+app run the same code.
+"""
+import uuid
+from concurrent.futures import wait
+
+import streamlit as st
+
+from job_scheduler import JobScheduler, Overloaded
+from merge_engine import (ContentRasterCache, DocumentCache, HeaderCache, STAGE_SAVE, STAGE_STAMP, ThumbnailCache,
+                          file_type, merge_pdf, preview_dpi, submit_docx)
+from result_cache import ResultCache, content_hash, result_key
+
+READ_ERROR = "File Corrupt or Locked (फाइल खराब आहे)"
+
+def init_session():
+    """Session keys the helpers below rely on."""
+    if "result" not in st.session_state:
+        st.session_state.result = None
+    if "user_id" not in st.session_state:
+        st.session_state.user_id = uuid.uuid4().hex  # one browser session = one user for the merge queue
+    if "gallery_first" not in st.session_state:
+        st.session_state.gallery_first = 0  # first page shown in the page gallery
+    if "docs" not in st.session_state:
+        st.session_state.docs = DocumentCache()  # parsed uploads, kept open across reruns
+
+# --- SHARED CACHES ---
+
+@st.cache_resource
+def get_header_cache():
+    """One letterhead cache shared by every session of this server."""
+    return HeaderCache()
+
+@st.cache_resource
+def get_scheduler():
+    """One merge queue for every session of this server."""
+    return JobScheduler()
+
+@st.cache_resource
+def get_result_cache():
+    """Merged PDFs and Word files on disk, so identical requests skip the merge and the conversion."""
+    return ResultCache()
+
+@st.cache_resource
+def get_preview_cache():
+    """Content-page rasters for the preview, keyed by content hash."""
+    return ContentRasterCache(max_entries=32)
+
+@st.cache_resource
+def get_thumbnail_cache():
+    """Merged-page thumbnails for the page gallery, shared by all sessions."""
+    return ThumbnailCache()
+
+def content_doc(data_file):
+    """Opener for the preview caches: the session's parsed copy of the upload (see DocumentCache)."""
+    docs = st.session_state.docs
+    return lambda: docs.use(data_file, file_type(data_file.name))
+
+def page_count(data_file):
+    """Pages in the content upload, from the session's parsed copy."""
+    return st.session_state.docs.page_count(data_file, file_type(data_file.name))
+
+# --- PREVIEW & GALLERY ---
+
+def generate_preview(header_file, data_file, cfg, width):
+    """Yields images of the first page for preview: a quick draft, then the sharp one.
+
+    Both pages are rasterized once per resolution and cached, so moving a
+    slider only re-composites the two images. The resolution follows
+    `width` (px the preview is shown at), so no more pixels are sent than
+    the column shows.
+    """
+    try:
+        hinfo = get_header_cache().analyze(header_file.getbuffer(), file_type(header_file.name))
+        yield from get_preview_cache().previews(hinfo, data_file.getbuffer(), cfg, file_type(data_file.name),
+                                                dpi=preview_dpi(width, hinfo.width), opener=content_doc(data_file))
+    except Exception:
+        return
+
+GALLERY_PAGES = 6  # thumbnails per gallery page
+
+def turn_gallery(step):
+    """Button callback: runs before the rerun, so the buttons are drawn for the new gallery page."""
+    st.session_state.gallery_first = max(0, st.session_state.gallery_first + step)
+
+def show_gallery(header_file, data_file, cfg):
+    """Paged strip of merged-page thumbnails. Only the gallery page on screen is rendered."""
+    try:
+        hinfo = get_header_cache().analyze(header_file.getbuffer(), file_type(header_file.name))
+        thumbs = get_thumbnail_cache()
+        total = thumbs.page_count(hinfo, data_file.getbuffer(), cfg, file_type(data_file.name),
+                                  opener=content_doc(data_file))
+    except Exception as e:
+        st.error(f"Preview failed: {e}" if isinstance(e, ValueError) else "Preview failed. Check files.")
+        return
+    # Clamped in case the page count shrank (new settings or upload)
+    first = st.session_state.gallery_first = min(st.session_state.gallery_first,
+                                                 (total - 1) // GALLERY_PAGES * GALLERY_PAGES)
+    nav1, nav2, nav3 = st.columns([1, 4, 1])
+    nav1.button("◀", key="gallery_prev", disabled=first == 0, on_click=turn_gallery, args=(-GALLERY_PAGES,))
+    nav3.button("▶", key="gallery_next", disabled=first + GALLERY_PAGES >= total, on_click=turn_gallery,
+                args=(GALLERY_PAGES,))
+    pnos = list(range(first, min(total, first + GALLERY_PAGES)))
+    nav2.caption(f"Pages {pnos[0] + 1}–{pnos[-1] + 1} of {total}")
+    with st.spinner("Rendering pages..."):
+        images = thumbs.thumbnails(hinfo, data_file.getbuffer(), pnos, cfg, file_type(data_file.name),
+                                   opener=content_doc(data_file))
+    cols = st.columns(3)
+    for n, (pno, img) in enumerate(zip(pnos, images)):
+        cols[n % 3].image(img, caption=f"Page {pno + 1}", use_container_width=True)
+
+# --- MERGE ---
+
+def process_merge(headers, results, docs, header_file, data_file, cfg, read_error=READ_ERROR, progress=None):
+    """(pdf, err) for the uploads, from the result cache when the same merge was done before.
+
+    Runs on a queue worker, where st.cache_resource and st.session_state
+    have no session: the caches come in bound by queued_merge.
+    """
+    try:
+        hinfo = headers.analyze(header_file.getbuffer(), file_type(header_file.name))
+    except:
+        return None, read_error
+
+    key = result_key(hinfo.key, content_hash(data_file.getbuffer()), cfg)
+    pdf = results.get(key, "pdf")
+    if pdf is not None:
+        return pdf, None
+    try:
+        with docs.use(data_file, file_type(data_file.name)) as d_doc:
+            try:
+                pdf = merge_pdf(hinfo, d_doc, cfg, progress)
+            except Exception as e:
+                return None, str(e)
+    except:
+        return None, read_error
+    results.put(key, "pdf", pdf)
+    return pdf, None
+
+def queued_merge(status, label, cost, header_file, data_file, cfg, read_error=READ_ERROR):
+    """Runs process_merge on the shared queue.
+
+    Shows the queue position in the status box while waiting, then draws
+    the stamping progress the worker reports. Returns (pdf, err).
+    """
+    state = {}
+    try:
+        job = get_scheduler().submit(st.session_state.user_id, cost, process_merge, get_header_cache(),
+                                     get_result_cache(), st.session_state.docs, header_file, data_file, cfg,
+                                     read_error,
+                                     progress=lambda stage, done, total: state.update({stage: (done, total)}))
+    except Overloaded as e:
+        return None, str(e)
+    bar, place_shown, pct_shown = None, None, -1
+    try:
+        while True:
+            finished = bool(wait([job], timeout=0.2).done)
+            place = get_scheduler().position(job)  # 0 once a worker has started it
+            if place:
+                if place != place_shown:
+                    status.update(label=f"⏳ In queue: {place - 1} job(s) ahead (रांगेत)" if place > 1
+                                  else "⏳ Next in queue (रांगेत)")
+                    place_shown = place
+            else:
+                if bar is None:
+                    if place_shown: status.update(label="Processing... (प्रक्रिया सुरू आहे)")
+                    bar = st.progress(0, text=label)
+                done, total = state.get(STAGE_STAMP, (0, 1))
+                if done * 100 // total != pct_shown:
+                    pct_shown = done * 100 // total
+                    bar.progress(pct_shown, text=f"{label} {done}/{total} pages" if done else label)
+            if finished: break
+    finally:
+        job.cancel()  # the session reran or went away: drop the job if it has not started
+    if STAGE_SAVE in state: st.write("💾 PDF saved")
+    return job.result()
+
+# --- DOWNLOADS ---
+
+def new_result(pdf, name, files, docx_cost=0):
+    """Session result for a fresh PDF; its Word job reports converted pages into docx_pages.
+
+    A conversion that actually runs counts `docx_cost` against the merge queue's backlog.
+    """
+    pages = {"done": 0, "total": 0}
+    job = get_result_cache().job(content_hash(pdf), "docx", lambda: submit_docx(
+        pdf, progress=lambda stage, done, total: pages.update(done=done, total=total)))
+    if not job.done(): get_scheduler().track(job, docx_cost)
+    return {"pdf": pdf, "name": name, "docx_job": job, "docx_pages": pages, "files": files}
+
+def drop_result():
+    """Forgets the last output and cancels its Word job if it has not started."""
+    res = st.session_state.result
+    if res: res["docx_job"].cancel()
+    st.session_state.result = None
+
+def word_download(res):
+    """Shows the Word button once the background conversion has finished."""
+    job = res["docx_job"]
+    if not job.done():
+        pages = res["docx_pages"]
+        st.info("⏳ Preparing Word file... (वर्ड फाइल तयार होत आहे)")
+        if pages["total"]:
+            st.progress(pages["done"] / pages["total"], text=f"{pages['done']}/{pages['total']} pages converted")
+        return
+    if job.cancelled() or job.exception():
+        st.error("Word conversion failed.")
+        return
+    st.download_button("⬇ Download Word", job.result(), file_name=f"{res['name']}.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
+
+def show_downloads(header_file, data_file):
+    """PDF and Word buttons for the session's result, while it belongs to the current uploads."""
+    res = st.session_state.result
+    if res and header_file and data_file and res["files"] == (header_file.file_id, data_file.file_id):
+        d1, d2 = st.columns(2)
+        with d1:
+            st.download_button("⬇ Download PDF", res["pdf"], file_name=f"{res['name']}.pdf", mime="application/pdf", use_container_width=True)
+        with d2:
+            # Poll until the job is done, then rerun once so the polling stops
+            if res["docx_job"].done():
+                word_download(res)
+            else:
+                @st.fragment(run_every=1)
+                def poll_word():
+                    if res["docx_job"].done(): st.rerun()
+                    word_download(res)
+                poll_word()
+    elif res:
+        drop_result()  # uploads changed: the old job is no longer wanted